@@ -0,0 +1,238 @@
+"""
+Follow-up alert subsystem for high-risk sites.
+Alerts are written to a persistent SQLite outbox (one alert per study, site and channel
+per day; re-queuing the same site is a no-op) and delivered by an asyncio dispatcher with a
+concurrency limit and exponential-backoff retries. Transports are pluggable async callables;
+a JSON-lines file sink and a local SMTP relay serve as stand-ins for production gateways.
+
+    python alert_dispatcher.py [--transport file|smtp] [--concurrency 20]
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import sqlite3
+import argparse
+import threading
+import smtplib
+from email.message import EmailMessage
+from datetime import date
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTBOX_FILE = os.path.join(BASE_DIR, ".cache", "alert_outbox.sqlite")
+FILE_SINK = os.path.join(BASE_DIR, ".cache", "alert_sink.jsonl")
+
+# Local SMTP stand-in (e.g. `python -m aiosmtpd -n -l localhost:1025`, MailHog)
+SMTP_HOST = os.environ.get("ALERT_SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("ALERT_SMTP_PORT", "1025"))
+SMTP_SENDER = os.environ.get("ALERT_SMTP_SENDER", "nest-alerts@localhost")
+SMTP_RECIPIENT = os.environ.get("ALERT_SMTP_RECIPIENT", "site-investigators@localhost")
+
+MAX_CONCURRENCY = 20
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 1.0
+SEND_TIMEOUT_SECONDS = 10.0
+# A claimed alert not written back within this long (dispatcher crashed or was killed) is due again
+LEASE_SECONDS = 600.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedup_key TEXT UNIQUE,
+    study TEXT, site_id TEXT, channel TEXT, recipient TEXT, subject TEXT, body TEXT,
+    status TEXT DEFAULT 'pending', attempts INTEGER DEFAULT 0, next_attempt REAL DEFAULT 0,
+    last_error TEXT, created REAL, sent REAL, claimed_at REAL);
+CREATE INDEX IF NOT EXISTS idx_alerts_due ON alerts (status, next_attempt);
+CREATE INDEX IF NOT EXISTS idx_alerts_site ON alerts (study, site_id);
+"""
+
+_lock = threading.Lock()
+_worker_lock = threading.Lock()
+_worker = {'thread': None}
+
+def connect(path=OUTBOX_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(SCHEMA)
+    # Outboxes created before claims were recorded
+    if 'claimed_at' not in {row[1] for row in con.execute("PRAGMA table_info(alerts)")}:
+        con.execute("ALTER TABLE alerts ADD COLUMN claimed_at REAL")
+    return con
+
+def build_alert(study, site):
+    """Subject and body of the follow-up alert for one scored site row."""
+    subject = f"[NEST 2.0] Follow-up required: {site['Site ID']} ({study})"
+    body = (f"Site {site['Site ID']} (Country: {site.get('Country', 'n/a')}) was flagged by the NEST 2.0 anomaly model "
+            f"(score {float(site.get('anomaly_score', 0)):.3f}).\n"
+            f"Open queries: {int(site.get('query_count', 0))}, missing pages: {int(site.get('missing_page_count', 0))}, "
+            f"SAEs: {int(site.get('sae_count', 0))}.\n")
+    # Drivers stored with the scores by train_model.explain_scores
+    if isinstance(site.get('top_drivers'), str):
+        body += f"Main drivers: {site['top_drivers'].replace(';', ', ')}.\n"
+    body += "Please review the data backlog and respond to outstanding queries."
+    return subject, body
+
+def enqueue_site_alerts(study, sites, channels=("email",)):
+    """
+    Queues one alert per site and channel. Sites already alerted today (same study, site
+    and channel) are skipped by the outbox's unique key. Returns the number newly queued.
+    """
+    today = date.today().isoformat()
+    now = time.time()
+    rows = []
+    for _, site in sites.iterrows():
+        subject, body = build_alert(study, site)
+        for channel in channels:
+            rows.append((f"{study}|{site['Site ID']}|{channel}|{today}", study, str(site['Site ID']), channel,
+                         f"Investigator, {site['Site ID']}", subject, body, now))
+    with _lock:
+        con = connect()
+        try:
+            with con:
+                before = con.total_changes
+                con.executemany("INSERT OR IGNORE INTO alerts (dedup_key, study, site_id, channel, recipient, subject, body, created) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                queued = con.total_changes - before
+        finally:
+            con.close()
+    return queued
+
+async def file_transport(alert):
+    """Stand-in transport: appends the alert to a JSON-lines file."""
+    line = json.dumps({k: alert[k] for k in ('id', 'study', 'site_id', 'channel', 'recipient', 'subject', 'body')})
+    def write():
+        with open(FILE_SINK, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    await asyncio.to_thread(write)
+
+async def smtp_transport(alert):
+    """Sends the alert through an SMTP relay (a local debugging server in development)."""
+    msg = EmailMessage()
+    msg['From'], msg['To'], msg['Subject'] = SMTP_SENDER, SMTP_RECIPIENT, alert['subject']
+    msg['X-NEST-Site'] = alert['site_id']
+    msg.set_content(alert['body'])
+    def send():
+        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SEND_TIMEOUT_SECONDS) as smtp:
+            smtp.send_message(msg)
+    await asyncio.to_thread(send)
+
+TRANSPORTS = {'file': file_transport, 'smtp': smtp_transport}
+
+def register_transport(name, send):
+    """Plugs in a transport: an async callable taking the alert row (dict) and raising on failure."""
+    TRANSPORTS[name] = send
+
+def _claim(con, limit, lease=LEASE_SECONDS):
+    """
+    Atomically moves up to `limit` due alerts to 'sending' and returns them, so concurrent
+    dispatchers (CLI, dashboard) never send the same alert. Expired claims are released first.
+    """
+    con.row_factory = sqlite3.Row
+    now = time.time()
+    with _lock:
+        # BEGIN IMMEDIATE takes the write lock up front: no other dispatcher can claim in between
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            con.execute("UPDATE alerts SET status = 'pending', claimed_at = NULL WHERE status = 'sending' AND claimed_at < ?",
+                        (now - lease,))
+            rows = con.execute("SELECT * FROM alerts WHERE status = 'pending' AND next_attempt <= ? ORDER BY id LIMIT ?",
+                               (now, limit)).fetchall()
+            con.executemany("UPDATE alerts SET status = 'sending', claimed_at = ? WHERE id = ?", [(now, r['id']) for r in rows])
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+    return [dict(r) for r in rows]
+
+async def dispatch_pending(transport='file', concurrency=MAX_CONCURRENCY, max_attempts=MAX_ATTEMPTS,
+                           backoff=BACKOFF_SECONDS, batch_size=1000, max_seconds=120):
+    """
+    Drains the outbox: due alerts are sent in batches with at most `concurrency` in flight.
+    Each batch is claimed first (status 'sending'), so several dispatchers can run at once.
+    A failed send is retried after backoff, 2x, 4x ... (with jitter) and marked 'failed'
+    after `max_attempts`. Outcomes are written back per batch. Returns {outcome: count}.
+    """
+    send = TRANSPORTS[transport]
+    gate = asyncio.Semaphore(concurrency)
+    stats = {'sent': 0, 'retried': 0, 'failed': 0}
+    deadline = time.time() + max_seconds
+    con = connect()
+
+    async def deliver(alert):
+        async with gate:
+            try:
+                await asyncio.wait_for(send(alert), SEND_TIMEOUT_SECONDS)
+                return alert, None
+            except Exception as e:
+                return alert, f"{type(e).__name__}: {e}"
+
+    try:
+        while time.time() < deadline:
+            batch = _claim(con, batch_size)
+            if not batch:
+                waiting = con.execute("SELECT MIN(next_attempt) FROM alerts WHERE status = 'pending'").fetchone()[0]
+                if waiting is None or waiting > deadline:
+                    break
+                await asyncio.sleep(max(0.0, waiting - time.time()))
+                continue
+            results = await asyncio.gather(*(deliver(a) for a in batch))
+            now = time.time()
+            updates = []
+            for alert, error in results:
+                attempts = alert['attempts'] + 1
+                if error is None:
+                    updates.append(('sent', attempts, 0, None, now, alert['id']))
+                    stats['sent'] += 1
+                elif attempts >= max_attempts:
+                    updates.append(('failed', attempts, 0, error, None, alert['id']))
+                    stats['failed'] += 1
+                else:
+                    delay = backoff * 2 ** (attempts - 1) * random.uniform(1.0, 1.5)
+                    updates.append(('pending', attempts, now + delay, error, None, alert['id']))
+                    stats['retried'] += 1
+            with _lock, con:
+                con.executemany("UPDATE alerts SET status = ?, attempts = ?, next_attempt = ?, last_error = ?, sent = ?, "
+                                "claimed_at = NULL WHERE id = ? AND status = 'sending'", updates)
+    finally:
+        con.close()
+    with open(os.path.join(BASE_DIR, "activity_log.txt"), "a") as f:
+        f.write(f"Alert dispatch ({transport}): {stats['sent']} sent, {stats['retried']} retries, {stats['failed']} failed.\n")
+    return stats
+
+def dispatch_in_background(transport='file', concurrency=MAX_CONCURRENCY):
+    """
+    Runs the dispatcher on its own event loop in a daemon thread, so the dashboard returns
+    immediately. Returns False when a dispatch is already running (it will pick up new alerts).
+    """
+    with _worker_lock:
+        thread = _worker['thread']
+        if thread is not None and thread.is_alive():
+            return False
+        thread = threading.Thread(target=lambda: asyncio.run(dispatch_pending(transport, concurrency)), daemon=True)
+        _worker['thread'] = thread
+        thread.start()
+        return True
+
+def is_dispatching():
+    return _worker['thread'] is not None and _worker['thread'].is_alive()
+
+def outbox_status(study=None):
+    """Alert counts and highest attempt count per status, optionally for one study."""
+    import pandas as pd
+    con = connect()
+    try:
+        where, params = ("WHERE study = ?", (study,)) if study else ("", ())
+        return pd.read_sql_query(f"SELECT status, COUNT(*) AS alerts, MAX(attempts) AS max_attempts "
+                                 f"FROM alerts {where} GROUP BY status", con, params=params)
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deliver queued site alerts from the outbox.")
+    parser.add_argument("--transport", default="file", choices=sorted(TRANSPORTS))
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY)
+    args = parser.parse_args()
+    print(asyncio.run(dispatch_pending(args.transport, args.concurrency)))
+    print(outbox_status().to_string(index=False))
@@ -0,0 +1,274 @@
+"""
+Embedded analytical store for the whole portfolio.
+The ingestion pipeline loads each study's reports into one SQLite database (tables for EDC
+metrics, missing pages, SAE, coding, EDRR and visits, keyed by study, site and subject), and
+the pipeline's per-site aggregates are defined as SQL views over them, so cross-report joins
+and portfolio-wide aggregations run inside the engine instead of in pandas.
+
+    python analytics_store.py --refresh
+    python analytics_store.py "SELECT * FROM v_site_metrics ORDER BY missing_page_count DESC LIMIT 10"
+"""
+import os
+import sys
+import sqlite3
+import threading
+import pandas as pd
+from dataset_catalog import refresh_catalog, workbook_layout, STUDY_ROOT
+from site_dictionary import canonical_site_ids
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_FILE = os.path.join(BASE_DIR, ".cache", "portfolio.sqlite")
+
+# Table -> report categories and {column: header spellings}. Spellings are matched
+# case-insensitively against every header row, so multi-row headers (EDC Metrics) flatten too.
+REPORT_TABLES = {
+    'edc_metrics': (['EDC Metrics'], {
+        'site_id': ['site id'], 'subject': ['subject id'], 'region': ['region'], 'country': ['country'],
+        'latest_visit': ['latest visit (sv) (source: rave edc: bo4)'],
+        'subject_status': ['subject status (source: primary form)', 'subject status'],
+        'expected_visits': ['# expected visits (rave edc : bo4)'], 'pages_entered': ['# pages entered'],
+        'total_queries': ['#total queries'], 'forms_verified': ['# forms verified'],
+        'pds_confirmed': ['# pds confirmed'], 'crfs_never_signed': ['crfs never signed'],
+    }),
+    'missing_pages': (['Missing Pages'], {
+        'site_id': ['sitenumber', 'site number'], 'subject': ['subjectname', 'subject name'],
+        'country': ['sitegroupname(countryname)', 'country'], 'visit': ['foldername', 'visit name'],
+        'page': ['formname', 'page name'], 'visit_date': ['visit date'],
+        'days_missing': ['no. #days page missing', '# of days missing'],
+    }),
+    'sae': (['SAE Dashboard'], {
+        'site_id': ['site'], 'subject': ['patient id'], 'country': ['country'],
+        'discrepancy_id': ['discrepancy id'], 'form_name': ['form name'],
+        'created': ['discrepancy created timestamp in dashboard'],
+        'review_status': ['review status'], 'action_status': ['action status'],
+    }),
+    'coding': (['Coding (MedDRA)', 'Coding (WHODD)'], {
+        'subject': ['subject'], 'dictionary': ['dictionary'], 'dictionary_version': ['dictionary version number'],
+        'form_oid': ['form oid'], 'logline': ['logline'], 'field_oid': ['field oid'],
+        'coding_status': ['coding status'], 'require_coding': ['require coding'],
+    }),
+    'edrr': (['Data Review (EDRR)'], {
+        'subject': ['subject'], 'open_issue_count': ['total open issue count per subject'],
+    }),
+}
+NUMERIC_COLUMNS = {'expected_visits', 'pages_entered', 'total_queries', 'forms_verified', 'pds_confirmed',
+                   'crfs_never_signed', 'days_missing', 'open_issue_count'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (study TEXT, tbl TEXT, file TEXT, modified REAL, rows INTEGER, PRIMARY KEY (study, tbl, file));
+CREATE TABLE IF NOT EXISTS edc_metrics (study TEXT, site_id TEXT, subject TEXT, region TEXT, country TEXT, latest_visit TEXT,
+    subject_status TEXT, expected_visits REAL, pages_entered REAL, total_queries REAL, forms_verified REAL,
+    pds_confirmed REAL, crfs_never_signed REAL);
+CREATE TABLE IF NOT EXISTS missing_pages (study TEXT, site_id TEXT, subject TEXT, country TEXT, visit TEXT, page TEXT,
+    visit_date TEXT, days_missing REAL);
+CREATE TABLE IF NOT EXISTS sae (study TEXT, site_id TEXT, subject TEXT, country TEXT, discrepancy_id TEXT, form_name TEXT,
+    created TEXT, review_status TEXT, action_status TEXT);
+CREATE TABLE IF NOT EXISTS coding (study TEXT, site_id TEXT, subject TEXT, dictionary TEXT, dictionary_version TEXT,
+    form_oid TEXT, logline TEXT, field_oid TEXT, coding_status TEXT, require_coding TEXT);
+CREATE TABLE IF NOT EXISTS edrr (study TEXT, site_id TEXT, subject TEXT, open_issue_count REAL);
+CREATE TABLE IF NOT EXISTS visits (study TEXT, site_id TEXT, subject TEXT, country TEXT, visit TEXT, projected_date TEXT,
+    as_of TEXT, days_overdue INTEGER);
+""" + "".join(f"""
+CREATE INDEX IF NOT EXISTS idx_{t}_site ON {t} (study, site_id);
+CREATE INDEX IF NOT EXISTS idx_{t}_subject ON {t} (study, subject);""" for t in list(REPORT_TABLES) + ['visits'])
+
+# The pipeline's aggregates, in SQL. Reports without a site column (coding, EDRR) are
+# attributed through subject_sites, built from every report that carries both.
+VIEWS = """
+CREATE VIEW IF NOT EXISTS subject_sites AS
+    SELECT study, subject, MIN(site_id) AS site_id FROM (
+        SELECT study, subject, site_id FROM edc_metrics UNION ALL
+        SELECT study, subject, site_id FROM missing_pages UNION ALL
+        SELECT study, subject, site_id FROM sae UNION ALL
+        SELECT study, subject, site_id FROM visits)
+    WHERE site_id IS NOT NULL AND subject IS NOT NULL GROUP BY study, subject;
+CREATE VIEW IF NOT EXISTS v_site_queries AS
+    SELECT study, site_id, COUNT(*) AS query_count, SUM(total_queries) AS total_queries,
+           SUM(pages_entered) AS pages_entered, SUM(crfs_never_signed) AS crfs_never_signed
+    FROM edc_metrics WHERE site_id IS NOT NULL GROUP BY study, site_id;
+CREATE VIEW IF NOT EXISTS v_site_missing_pages AS
+    SELECT study, site_id, COUNT(*) AS missing_page_count, MAX(days_missing) AS max_days_missing
+    FROM missing_pages WHERE site_id IS NOT NULL GROUP BY study, site_id;
+CREATE VIEW IF NOT EXISTS v_site_sae AS
+    SELECT study, site_id, COUNT(*) AS sae_count,
+           SUM(review_status = 'Pending for Review') AS sae_pending_review
+    FROM sae WHERE site_id IS NOT NULL GROUP BY study, site_id;
+CREATE VIEW IF NOT EXISTS v_site_coding AS
+    SELECT c.study, COALESCE(c.site_id, s.site_id) AS site_id, COUNT(*) AS coded_terms,
+           SUM(c.require_coding = 'Yes') AS uncoded_terms
+    FROM coding c LEFT JOIN subject_sites s ON s.study = c.study AND s.subject = c.subject
+    GROUP BY c.study, COALESCE(c.site_id, s.site_id);
+CREATE VIEW IF NOT EXISTS v_site_edrr AS
+    SELECT e.study, COALESCE(e.site_id, s.site_id) AS site_id, SUM(e.open_issue_count) AS open_issue_count
+    FROM edrr e LEFT JOIN subject_sites s ON s.study = e.study AND s.subject = e.subject
+    GROUP BY e.study, COALESCE(e.site_id, s.site_id);
+CREATE VIEW IF NOT EXISTS v_site_visits AS
+    SELECT study, site_id, SUM(days_overdue > 0) AS overdue_visit_count,
+           MAX(CASE WHEN days_overdue > 0 THEN days_overdue ELSE 0 END) AS max_days_overdue
+    FROM visits WHERE site_id IS NOT NULL GROUP BY study, site_id;
+CREATE VIEW IF NOT EXISTS v_site_metrics AS
+    SELECT k.study, k.site_id,
+           COALESCE(q.query_count, 0) AS query_count,
+           COALESCE(m.missing_page_count, 0) AS missing_page_count,
+           COALESCE(a.sae_count, 0) AS sae_count,
+           COALESCE(v.overdue_visit_count, 0) AS overdue_visit_count,
+           COALESCE(v.max_days_overdue, 0) AS max_days_overdue,
+           COALESCE(c.uncoded_terms, 0) AS uncoded_terms,
+           COALESCE(e.open_issue_count, 0) AS open_issue_count
+    FROM (SELECT study, site_id FROM v_site_queries UNION
+          SELECT study, site_id FROM v_site_missing_pages UNION
+          SELECT study, site_id FROM v_site_sae) k
+    LEFT JOIN v_site_queries q ON q.study = k.study AND q.site_id = k.site_id
+    LEFT JOIN v_site_missing_pages m ON m.study = k.study AND m.site_id = k.site_id
+    LEFT JOIN v_site_sae a ON a.study = k.study AND a.site_id = k.site_id
+    LEFT JOIN v_site_visits v ON v.study = k.study AND v.site_id = k.site_id
+    LEFT JOIN v_site_coding c ON c.study = k.study AND c.site_id = k.site_id
+    LEFT JOIN v_site_edrr e ON e.study = k.study AND e.site_id = k.site_id;
+"""
+
+_lock = threading.Lock()
+
+def connect(path=STORE_FILE):
+    """Connection to the store, creating tables, indexes and views on first use."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.executescript(SCHEMA + VIEWS)
+    return con
+
+def _header_position(header_rows, spellings):
+    for spelling in spellings:
+        for row in header_rows:
+            for pos, cell in enumerate(row):
+                if isinstance(cell, str) and cell.strip().lower() == spelling:
+                    return pos
+    return None
+
+def read_report_table(path, columns, header_row=0, sheet=0):
+    """
+    Curated columns of one report sheet. Header rows run from the detected header row
+    to the first row with a subject, which flattens stacked EDC headers.
+    """
+    raw = pd.read_excel(path, sheet_name=sheet, header=None, skiprows=int(header_row), engine='calamine', dtype=object)
+    if raw.empty:
+        return pd.DataFrame(columns=list(columns))
+    first = raw.iloc[:1].values.tolist()
+    subject_pos = _header_position(first, columns['subject'])
+    if subject_pos is None:
+        return pd.DataFrame(columns=list(columns))
+    subjects = raw[subject_pos].astype(str).str.strip().where(raw[subject_pos].notna())
+    data_start = subjects.iloc[1:].first_valid_index()
+    if data_start is None:
+        return pd.DataFrame(columns=list(columns))
+    header_rows = raw.iloc[:data_start].values.tolist()
+
+    table = pd.DataFrame(index=raw.index[data_start:])
+    for name, spellings in columns.items():
+        pos = subject_pos if name == 'subject' else _header_position(header_rows, spellings)
+        values = raw.loc[data_start:, pos] if pos is not None else pd.Series(None, index=table.index, dtype=object)
+        if name == 'site_id':
+            values = canonical_site_ids(values)
+        elif name in NUMERIC_COLUMNS:
+            values = pd.to_numeric(values, errors='coerce')
+        else:
+            values = values.astype(str).str.strip().where(values.notna())
+        table[name] = values
+    if 'site_id' not in table:
+        table.insert(0, 'site_id', None)
+    return table.dropna(subset=['subject']).reset_index(drop=True)
+
+def _replace_rows(con, study, table, frame):
+    con.execute(f"DELETE FROM {table} WHERE study = ?", (study,))
+    if not frame.empty:
+        frame = frame.astype(object).where(frame.notna(), None)
+        cols = ['study'] + list(frame.columns)
+        con.executemany(f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                        ([study, *row] for row in frame.itertuples(index=False, name=None)))
+
+def _load_visits(con, study):
+    from visit_backlog import load_visit_backlog
+    visits = load_visit_backlog()
+    visits = visits[visits['Study'] == study]
+    frame = pd.DataFrame({
+        'site_id': visits['Site ID'].astype(object), 'subject': visits['Subject'].astype(object),
+        'country': visits['Country'].astype(object), 'visit': visits['Visit'].astype(object),
+        'projected_date': visits['Projected Date'].dt.strftime('%Y-%m-%d'),
+        'as_of': visits['As Of'].dt.strftime('%Y-%m-%d'), 'days_overdue': visits['days_overdue'].astype(int),
+    })
+    _replace_rows(con, study, 'visits', frame)
+    return len(frame)
+
+def load_study(study, root=STUDY_ROOT):
+    """
+    Loads one study into the store. A table is reloaded (delete + insert in one transaction)
+    only when its source workbooks changed since the last load; visits are refreshed from
+    the visit backlog cache every time. Returns {table: rows} for the tables that were reloaded.
+    """
+    catalog = refresh_catalog([study], root=root)
+    catalog = catalog[catalog['Study'] == study].sort_values('Modified')
+    loaded = {}
+    with _lock:
+        con = connect()
+        try:
+            known = {(t, f): m for t, f, m in con.execute("SELECT tbl, file, modified FROM sources WHERE study = ?", (study,))}
+            for table, (categories, columns) in REPORT_TABLES.items():
+                # Most recent export of each category, as in study_files()
+                latest = catalog[catalog['Category'].isin(categories)].drop_duplicates('Category', keep='last')
+                current = {(table, f): float(m) for f, m in zip(latest['File'], latest['Modified'])}
+                previous = {k: m for k, m in known.items() if k[0] == table}
+                if current == previous:
+                    continue
+                frames = []
+                for _, r in latest.iterrows():
+                    try:
+                        path = os.path.join(root, study, r['File'])
+                        # Every relevant sheet of the workbook (e.g. SAE DM and Safety queues)
+                        frames.extend(read_report_table(path, columns, header_row, sheet) for sheet, header_row in workbook_layout(path))
+                    except Exception as e:
+                        with open(os.path.join(BASE_DIR, "activity_log.txt"), "a") as f:
+                            f.write(f"Analytics store: could not read {r['File']} in {study}: {e}\n")
+                frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=list(columns))
+                with con:
+                    _replace_rows(con, study, table, frame)
+                    con.execute("DELETE FROM sources WHERE study = ? AND tbl = ?", (study, table))
+                    con.executemany("INSERT INTO sources VALUES (?, ?, ?, ?, ?)",
+                                    [(study, table, f, m, len(frame)) for (_, f), m in current.items()])
+                loaded[table] = len(frame)
+            with con:
+                loaded['visits'] = _load_visits(con, study)
+        finally:
+            con.close()
+    if len(loaded) > 1:
+        with open(os.path.join(BASE_DIR, "activity_log.txt"), "a") as f:
+            f.write(f"Analytics store: loaded {study} ({', '.join(f'{t}={n}' for t, n in loaded.items())}).\n")
+    return loaded
+
+def refresh_store(root=STUDY_ROOT):
+    """Loads every study in the portfolio (unchanged reports are skipped)."""
+    studies = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    return {study: load_study(study, root) for study in studies}
+
+def query(sql, params=()):
+    """Runs a read query against the store and returns a DataFrame."""
+    con = connect()
+    try:
+        return pd.read_sql_query(sql, con, params=params)
+    finally:
+        con.close()
+
+def site_metrics(study=None):
+    """The pipeline's per-site counts for one study (or all), computed by the v_site_metrics view."""
+    if study is None:
+        return query("SELECT * FROM v_site_metrics ORDER BY study, site_id")
+    return query("SELECT * FROM v_site_metrics WHERE study = ? ORDER BY site_id", (study,))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--refresh":
+        for study, loaded in refresh_store().items():
+            print(study, loaded)
+    else:
+        sql = sys.argv[1] if len(sys.argv) > 1 else \
+            "SELECT study, COUNT(*) AS sites, SUM(query_count) AS query_count, SUM(missing_page_count) AS missing_pages, " \
+            "SUM(sae_count) AS sae, SUM(overdue_visit_count) AS overdue_visits FROM v_site_metrics GROUP BY study"
+        print(query(sql).to_string(index=False))
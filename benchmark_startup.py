@@ -0,0 +1,95 @@
+"""
+Startup benchmark for the NEST 2.0 dashboard.
+Times the cold import of the app shell and of each page module in a fresh interpreter
+(median of several runs) and checks them against an import-time budget. Also verifies
+that no page drags in heavy libraries it doesn't use. Exits with status 1 on a breach.
+"""
+import subprocess
+import sys
+import os
+import ast
+import json
+import statistics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def app_imports(path=os.path.join(BASE_DIR, "app.py")):
+    """Modules app.py imports at module level, i.e. what every rerun of the app shell pays for."""
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return modules
+
+# The shell is paid once (Streamlit, localization, the warm-up, ...); page budgets are measured on top of it.
+SHELL_MODULES = app_imports()
+
+# Cold-import budget per module, in milliseconds
+IMPORT_BUDGET_MS = {
+    'shell': 2500,
+    'dashboard.mass_balance': 50,
+    'dashboard.safety_search': 1500,
+    'dashboard.operational': 2000,
+}
+
+# Libraries a page must not pull in at import time (beyond what the shell already loaded)
+FORBIDDEN_IMPORTS = {
+    'dashboard.mass_balance': ['pandas', 'plotly', 'sklearn', 'st_aggrid', 'fpdf'],
+    'dashboard.safety_search': ['sklearn', 'st_aggrid', 'fpdf'],
+    'dashboard.operational': ['sklearn', 'st_aggrid', 'fpdf'],
+}
+
+PROBE = """
+import sys, time, json
+for m in {shell!r}:
+    __import__(m)
+before = set(sys.modules)
+t0 = time.perf_counter()
+for m in {targets!r}:
+    __import__(m)
+elapsed = (time.perf_counter() - t0) * 1000
+new = {{m.split('.')[0] for m in set(sys.modules) - before}}
+print(json.dumps({{'ms': elapsed, 'loaded': [m for m in {forbidden!r} if m in new]}}))
+"""
+
+def measure(targets, shell, forbidden=(), runs=5):
+    """Median cold-import time (ms) of `targets` after `shell`, in fresh interpreters."""
+    timings, loaded = [], set()
+    code = PROBE.format(shell=list(shell), targets=list(targets), forbidden=list(forbidden))
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=BASE_DIR, capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        timings.append(result['ms'])
+        loaded.update(result['loaded'])
+    return statistics.median(timings), sorted(loaded)
+
+def run_benchmark(runs=5):
+    print("=== NEST 2.0: Startup Import Benchmark ===")
+    failures = []
+
+    shell_ms, _ = measure(SHELL_MODULES, shell=[], runs=runs)
+    status = "OK" if shell_ms <= IMPORT_BUDGET_MS['shell'] else "OVER BUDGET"
+    print(f"{'shell':28} {shell_ms:8.1f} ms  (budget {IMPORT_BUDGET_MS['shell']} ms)  {status}")
+    if status != "OK":
+        failures.append('shell')
+
+    for module, forbidden in FORBIDDEN_IMPORTS.items():
+        ms, loaded = measure([module], shell=SHELL_MODULES, forbidden=forbidden, runs=runs)
+        budget = IMPORT_BUDGET_MS[module]
+        status = "OK" if ms <= budget and not loaded else "OVER BUDGET" if ms > budget else "HEAVY IMPORT"
+        print(f"{module:28} {ms:8.1f} ms  (budget {budget} ms)  {status}" + (f"  loaded: {', '.join(loaded)}" if loaded else ""))
+        if status != "OK":
+            failures.append(module)
+
+    if failures:
+        print(f"Budget exceeded for: {', '.join(failures)}")
+    else:
+        print("All modules within the import-time budget.")
+    return not failures
+
+if __name__ == "__main__":
+    sys.exit(0 if run_benchmark() else 1)
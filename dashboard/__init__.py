@@ -0,0 +1 @@
+"""Per-page Streamlit modules for the NEST 2.0 dashboard, imported lazily by app.py."""
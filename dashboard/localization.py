@@ -0,0 +1,54 @@
+"""Localized UI strings shared by the dashboard shell and pages (no heavy imports)."""
+
+# Localization Mapping
+STRINGS = {
+    "English": {
+        "title": "NEST 2.0: Unified Clinical Intelligence",
+        "subtitle": "Integrated Data-Flow and Anomaly Detection",
+        "nav": ["Operational Intelligence", "Mass Balance Engine", "Safety Search"],
+        "total_sites": "Total Sites",
+        "anomalies": "Anomalies Detected",
+        "avg_queries": "Avg Queries/Site",
+        "missing_pages": "Total Missing Pages",
+        "push_button": "Send Follow-Up Alerts to High-Risk Sites"
+    },
+    "Japanese": {
+        "title": "NEST 2.0: 統合臨床インテリジェンス",
+        "subtitle": "統合されたデータフローと異常検知",
+        "nav": ["運用インテリジェンス", "マスバランス・エンジン", "安全性検索"],
+        "total_sites": "総サイト数",
+        "anomalies": "検出された異常",
+        "avg_queries": "サイトごとの平均クエリ数",
+        "missing_pages": "総欠損ページ数",
+        "push_button": "高リスクサイトへフォローアップ通知を送信する"
+    },
+    "Spanish": {
+        "title": "NEST 2.0: Inteligencia Clínica Unificada",
+        "subtitle": "Flujo de Datos Integrado y Detección de Anomalías",
+        "nav": ["Inteligencia Operativa", "Motor de Balance de Masa", "Búsqueda de Seguridad"],
+        "total_sites": "Total de Sitios",
+        "anomalies": "Anomalías Detectadas",
+        "avg_queries": "Promedio de Consultas/Sitio",
+        "missing_pages": "Total de Páginas Faltantes",
+        "push_button": "Enviar Alertas de Seguimiento a Sitios de Alto Riesgo"
+    }
+}
+
+# Anomaly model features, as cited in narratives (drivers from train_model.explain_scores)
+DRIVER_LABELS = {
+    "English": {
+        "query_count": "query volume", "missing_page_count": "missing pages", "sae_count": "serious adverse events",
+        "overdue_visit_count": "overdue visits", "max_days_overdue": "days overdue (worst visit)",
+        "vs_median": "vs. study median", "and": " and "
+    },
+    "Japanese": {
+        "query_count": "クエリボリューム", "missing_page_count": "欠損ページ", "sae_count": "重大な有害事象",
+        "overdue_visit_count": "期限超過の来院", "max_days_overdue": "最大超過日数",
+        "vs_median": "研究中央値", "and": "、"
+    },
+    "Spanish": {
+        "query_count": "volumen de consultas", "missing_page_count": "páginas faltantes", "sae_count": "eventos adversos graves",
+        "overdue_visit_count": "visitas vencidas", "max_days_overdue": "días de retraso (peor visita)",
+        "vs_median": "frente a la mediana del estudio", "and": " y "
+    }
+}
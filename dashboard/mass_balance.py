@@ -0,0 +1,96 @@
+"""Mass Balance Engine page. Pure arithmetic - no pandas, plotly or scikit-learn at import."""
+import streamlit as st
+from warmup import note_activity
+
+def render():
+    st.title("Mass Balance Calculator")
+    st.markdown("""
+        Assessment of Mass Balance (MB) is critical in forced degradation studies to verify whether all components 
+        of a drug substance are accounted for.
+    """)
+
+    with st.expander("Why this matters? (Regulatory Context)", expanded=False):
+        st.write("""
+            Regulators expect MB recovery to be close to 100%. Lower values signal gaps in method sensitivity 
+            or incomplete detection of degradants.
+        """)
+
+    calculator_panel()
+    validation_panel()
+
+    with st.expander("Why Relative MB is the Winning Standard?", expanded=False):
+        st.write("""
+            **Methodology**: Simple Mass Balance (SMB) often masks sensitivity gaps. 
+            **Relative Mass Balance (RMB)** isolates the change in degradants relative to API loss, 
+            exposing hidden 'Invisible Gaps' in your analytical methods.
+        """)
+
+# Fragments: editing an input reruns only the calculator, the simulation only its own panel
+# (fragment reruns skip app.py, so each one reports the interaction to the warm-up itself)
+
+@st.fragment
+def calculator_panel():
+    note_activity()
+    # Input Section
+    c1, c2 = st.columns(2)
+    with c1:
+        st.subheader("Initial Sample Data")
+        api_initial = st.number_input("Initial API (%)", value=98.5, step=0.1)
+        deg_initial = st.number_input("Initial Degradants (%)", value=0.5, step=0.1)
+
+    with c2:
+        st.subheader("Stressed Sample Data")
+        api_stressed = st.number_input("Stressed API (%)", value=87.4, step=0.1)
+        deg_stressed = st.number_input("Stressed Degradants (%)", value=11.3, step=0.1)
+
+    # Calculations
+    smb = api_stressed + deg_stressed
+    amb = ((api_stressed + deg_stressed) / (api_initial + deg_initial)) * 100
+    ambd = 100 - amb
+
+    loss_of_api = max(0.1, api_initial - api_stressed)
+    increase_in_deg = max(0.1, deg_stressed - deg_initial)
+    rmb = (increase_in_deg / loss_of_api) * 100
+    rmbd = 100 - rmb
+
+    # Display Results
+    st.divider()
+    res1, res2, res3 = st.columns(3)
+
+    with res1:
+        st.metric("Simple Mass Balance (SMB)", f"{round(smb, 2)}%")
+        st.caption("Target: ~100%")
+
+    with res2:
+        st.metric("Absolute Mass Balance (AMB)", f"{round(amb, 2)}%")
+        st.caption("Considers initial Assay")
+
+    with res3:
+        st.metric("Relative Mass Balance (RMB)", f"{round(rmb, 2)}%")
+        st.caption("Shows detectability index")
+
+    # Recommendation Engine
+    st.subheader("AI Recommendation Matrix")
+    if amb < 95:
+        st.error(f"Warning: Absolute Mass Balance Deficiency (AMBD) is {round(ambd, 2)}%. Critical investigation required.")
+    elif rmb < 85:
+        st.warning(f"Caution: Relative Mass Balance is low ({round(rmb, 2)}%). This indicates poor detection of degradants.")
+    else:
+        st.success("Mass Balance is within acceptable regulatory thresholds.")
+
+@st.fragment
+def validation_panel():
+    note_activity()
+    # Scientific Validation Section
+    st.divider()
+    st.subheader("Scientific Validation & Detectability Analysis")
+    if st.button("Run Live Scientific Validation (MB Simulation)"):
+        with st.spinner("Running Monte-Carlo Simulation for MB Proofs..."):
+            # Capture stdout to show results
+            import io, contextlib
+            import validation_proofs
+            f = io.StringIO()
+            with contextlib.redirect_stdout(f):
+                validation_proofs.run_mb_validation_simulation()
+            st.code(f.getvalue())
+            st.success("Validation Complete: Relative Mass Balance confirmed as superior for regulatory submission.")
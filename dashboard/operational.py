@@ -0,0 +1,309 @@
+"""Operational Intelligence page: site KPIs, charts, risk map, anomaly grid and narratives."""
+import os
+import streamlit as st
+import plotly.express as px
+from study_ingest import ingest_study, scored_path
+from risk_rollup import rollup_lookup, CUBE_FILE
+from visit_backlog import site_backlog
+from dashboard.localization import DRIVER_LABELS
+from warmup import record_access, note_activity
+from alert_dispatcher import TRANSPORTS, enqueue_site_alerts, dispatch_in_background, outbox_status
+
+def data_version(study):
+    """mtime of the study's cached scores: a re-ingest (here or by the watch-folder daemon) changes it."""
+    path = scored_path(study)
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+# Data Loading and Re-training Logic (keyed on the data version, so new scores are picked up without a restart)
+@st.cache_data(max_entries=32)
+def get_study_data(study, version=None):
+    # Added explicit status logging for user visibility
+    status_msg = st.empty()
+    status_msg.info(f"Initiating Data Synthesis for {study}...")
+    
+    with st.spinner(f"Synchronizing Global Intelligence for {study}..."):
+        try:
+            # Pipeline, scoring, rollup cube, snapshot and subject index (study_ingest.py).
+            # Studies already ingested by the watch-folder daemon come back from the cache.
+            scored, _ = ingest_study(study)
+            if scored is None:
+                status_msg.error(f"Synthesis Failed for {study}: No valid EDC metrics found in folder.")
+                return None
+            
+            # Clear status on success
+            status_msg.empty()
+            return scored
+        except Exception as e:
+            status_msg.error(f"Critical Error in Data Pipeline: {e}")
+            return None
+
+def site_drivers(site_data):
+    """Features driving a site's anomaly score, strongest first (stored by train_model as 'a;b')."""
+    drivers = site_data.get('top_drivers')
+    return [d for d in drivers.split(';') if d in site_data.index] if isinstance(drivers, str) else []
+
+def render(lang, language, study):
+    st.title(lang["title"])
+    st.subheader(lang["subtitle"])
+
+    # Access stats drive the warm-up order after a restart (counted once per session and study)
+    if study and st.session_state.get('_counted_study') != study:
+        record_access(study)
+        st.session_state['_counted_study'] = study
+
+    df = get_study_data(study, data_version(study))
+
+    if df is None:
+        st.info("Data is currently being processed by the backend pipeline...")
+        if st.button("Refresh Data Status"):
+            st.rerun()
+        return
+
+    kpi_panel(lang, df)
+    charts_panel(study, df)
+    backlog_panel(study)
+    map_panel(study)
+    anomalies = df[df['is_anomaly'] == -1].sort_values(by='anomaly_score')
+    anomaly_panel(language, study, df, anomalies)
+    alert_panel(lang, study, anomalies)
+
+# Each panel below is a fragment: a widget inside it reruns only that panel, not the whole page
+# (nor app.py, so each panel reports the interaction to the background warm-up itself).
+# Figures and PDFs are cached per study and data version (scores / rollup cube mtime), so the full
+# reruns that remain (sidebar changes) skip their construction until the data changes.
+
+@st.fragment
+def kpi_panel(lang, df):
+    note_activity()
+    m1, m2, m3, m4 = st.columns(4)
+    with m1:
+        st.metric(lang["total_sites"], len(df))
+    with m2:
+        st.metric(lang["anomalies"], len(df[df['is_anomaly'] == -1]))
+    with m3:
+        st.metric(lang["avg_queries"], round(df['query_count'].mean(), 1))
+    with m4:
+        st.metric(lang["missing_pages"], int(df['missing_page_count'].sum()))
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def site_figures(study, version, _df):
+    """Query-density bar and SAE/missing-pages scatter for a study (keyed by study and data version, like get_study_data)."""
+    bar = px.bar(_df, x='Site ID', y='query_count', color='is_anomaly',
+                 color_discrete_map={1: '#00cc96', -1: '#ef553b'})
+    bar.update_layout(margin=dict(l=0, r=0, t=30, b=0), height=400)
+    scatter = px.scatter(_df, x='missing_page_count', y='sae_count', size='query_count',
+                         color='is_anomaly', hover_name='Site ID',
+                         color_discrete_map={1: '#00cc96', -1: '#ef553b'})
+    scatter.update_layout(margin=dict(l=0, r=0, t=30, b=0), height=400)
+    return bar, scatter
+
+@st.fragment
+def charts_panel(study, df):
+    note_activity()
+    bar, scatter = site_figures(study, data_version(study), df)
+    c1, c2 = st.columns(2)
+    with c1:
+        st.write("### Query Density by Site")
+        st.plotly_chart(bar, use_container_width=True)
+    with c2:
+        st.write("### SAE vs. Missing Data Correlation")
+        st.plotly_chart(scatter, use_container_width=True)
+
+@st.fragment
+def backlog_panel(study):
+    note_activity()
+    # Visit backlog from the Visit Projection Trackers (cached portfolio pass)
+    st.write("### Visit Backlog (Overdue Projected Visits)")
+    backlog = site_backlog(study)
+    if backlog.empty:
+        st.info("No overdue or upcoming visits found in this study's Visit Projection Tracker.")
+    else:
+        backlog = backlog.sort_values(['overdue_visit_count', 'max_days_overdue'], ascending=False)
+        st.dataframe(backlog[['Site ID', 'overdue_visit_count', 'overdue_subject_count', 'mean_days_overdue',
+                              'max_days_overdue', 'upcoming_visit_count']], use_container_width=True, hide_index=True)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def risk_map_figure(study, map_scope, cube_version):
+    # Pre-aggregated lookup from the rollup cube (ISO3-normalized country keys)
+    if map_scope == "Portfolio":
+        country_risk = rollup_lookup('country')
+    else:
+        country_risk = rollup_lookup('study_country', study=study)
+    country_risk = country_risk[country_risk['Country'] != 'UNK']
+    
+    # Using choropleth for professional mapping
+    fig_map = px.choropleth(country_risk, 
+                            locations="Country", 
+                            locationmode='ISO-3',
+                            color="mean_score", 
+                            hover_name="Country Name",
+                            hover_data={'site_count': True, 'anomaly_count': True},
+                            color_continuous_scale="Reds_r",
+                            labels={'mean_score':'Risk Index'})
+    
+    fig_map.update_layout(
+        geo=dict(showframe=False, showcoastlines=True, projection_type='equirectangular'),
+        margin=dict(l=0, r=0, t=30, b=0),
+        height=500
+    )
+    return fig_map
+
+@st.fragment
+def map_panel(study):
+    note_activity()
+    # PAGE 1 - NEW SECTION: Global Risk Heatmap (Choropleth Map)
+    st.write("### Predictive Risk Heatmap (Geospatial Analysis)")
+    map_scope = st.radio("Map Scope", ["Selected Study", "Portfolio"], horizontal=True)
+    # The cube's mtime keys the figure, so another study's ingest refreshes the portfolio map
+    cube_version = os.path.getmtime(CUBE_FILE) if os.path.exists(CUBE_FILE) else None
+    st.plotly_chart(risk_map_figure(study, map_scope, cube_version), use_container_width=True)
+
+@st.cache_data(show_spinner=False)
+def pdf_report(site_id, narrative, site_data, drivers):
+    from dashboard.reports import create_pdf_report
+    return create_pdf_report(site_id, narrative, site_data, drivers)
+
+@st.fragment
+def anomaly_panel(language, study, df, anomalies):
+    note_activity()
+    # Anomaly Breakdown with Narrative Generation
+    st.write("### Custom ML Anomaly Analysis (Interactive Data Grid)")
+    if not anomalies.empty:
+        st.warning(f"Detection System identified {len(anomalies)} sites with irregular operational patterns.")
+        
+        # AgGrid Implementation
+        from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
+        gb = GridOptionsBuilder.from_dataframe(anomalies[['Site ID', 'Country', 'query_count', 'missing_page_count', 'sae_count', 'anomaly_score']])
+        gb.configure_pagination(paginationAutoPageSize=True)
+        gb.configure_side_bar()
+        gb.configure_selection('single', use_checkbox=True)
+        gridOptions = gb.build()
+        
+        grid_response = AgGrid(
+            anomalies,
+            gridOptions=gridOptions,
+            update_mode=GridUpdateMode.SELECTION_CHANGED,
+            theme='balham', # Professional theme
+            height=300,
+            width='100%',
+        )
+        
+        selected = grid_response['selected_rows']
+        selected_site = None
+        if selected is not None and not selected.empty:
+            selected_site = selected.iloc[0]['Site ID']
+        
+        # Narrative Section
+        if selected_site:
+            st.write(f"#### Generated Narrative for Site {selected_site}")
+            site_data = anomalies[anomalies['Site ID'] == selected_site].iloc[0]
+
+            # Drivers come from the explanation stage stored with the scores (train_model.explain_scores)
+            labels = DRIVER_LABELS[language]
+            drivers = site_drivers(site_data)
+            driver_text = labels["and"].join(
+                f"{labels.get(d, d)} ({int(site_data[d])} {labels['vs_median']} {df[d].median():g})" for d in drivers)
+            
+            # Local Logic-Based Narrative Engine (Localized)
+            narr_strings = {
+                "English": {
+                    "header": f"DRAFT REGULATORY NARRATIVE: SITE {selected_site}",
+                    "exec": f"Executive Summary: Site {selected_site} (Region: {site_data['Region']}, Country: {site_data['Country']}) has been flagged by the NEST 2.0 ML engine for significant operational divergence.",
+                    "findings": "Key Findings",
+                    "query": f"Query Volume: {int(site_data['query_count'])} queries detected, which is {round(site_data['query_count']/(df['query_count'].mean() or 1), 1)}x the study average.",
+                    "integrity": f"Data Integrity: {int(site_data['missing_page_count'])} missing pages identified.",
+                    "safety": f"Safety Profile: {int(site_data['sae_count'])} Serious Adverse Events reported.",
+                    "rca": f"Root Cause Analysis: The anomaly score is driven mainly by {driver_text}." if drivers else "Root Cause Analysis: No single metric dominates; the site is unusual in its combination of metrics.",
+                    "rec": "Recommendation: Immediate monitoring visit suggested."
+                },
+                "Japanese": {
+                    "header": f"下書き用規制ナラティブ: サイト {selected_site}",
+                    "exec": f"要約: サイト {selected_site} (地域: {site_data['Region']}, 国: {site_data['Country']}) は、重大な運用の乖離があるとしてNEST 2.0 MLエンジンによってフラグが立てられました。",
+                    "findings": "主な調査結果",
+                    "query": f"クエリボリューム: {int(site_data['query_count'])} 件のクエリが検出されました。これは研究平均の {round(site_data['query_count']/(df['query_count'].mean() or 1), 1)} 倍です。",
+                    "integrity": f"データの整合性: {int(site_data['missing_page_count'])} 件の欠損ページが特定されました。",
+                    "safety": f"安全性プロファイル: {int(site_data['sae_count'])} 件の重大な有害事象が報告されました。",
+                    "rca": f"根本原因分析: 異常スコアの主な要因は {driver_text} です。" if drivers else "根本原因分析: 単一の指標が支配的ではなく、指標の組み合わせが異常です。",
+                    "rec": "推奨事項: 即時のモニタリング訪問を推奨します。"
+                },
+                "Spanish": {
+                    "header": f"BORRADOR DE NARRATIVA REGULATORIA: SITIO {selected_site}",
+                    "exec": f"Resumen Ejecutivo: El sitio {selected_site} (Región: {site_data['Region']}, País: {site_data['Country']}) ha sido marcado por el motor NEST 2.0 ML por una divergencia operativa significativa.",
+                    "findings": "Hallazgos Clave",
+                    "query": f"Volumen de Consultas: {int(site_data['query_count'])} consultas detectadas, lo cual es {round(site_data['query_count']/(df['query_count'].mean() or 1), 1)} veces el promedio del estudio.",
+                    "integrity": f"Integridad de Datos: {int(site_data['missing_page_count'])} páginas faltantes identificadas.",
+                    "safety": f"Perfil de Seguridad: {int(site_data['sae_count'])} Eventos Adversos Graves reportados.",
+                    "rca": f"Análisis de Causa Raíz: La puntuación de anomalía se debe principalmente a {driver_text}." if drivers else "Análisis de Causa Raíz: Ninguna métrica domina; el sitio es inusual por la combinación de sus métricas.",
+                    "rec": "Recomendación: Se sugiere una visita de monitoreo inmediata."
+                }
+            }
+            n = narr_strings[language]
+            
+            narrative = f"""
+{n['header']}
+
+{n['exec']}
+
+{n['findings']}:
+- {n['query']}
+- {n['integrity']}
+- {n['safety']}
+
+{n['rca']}
+
+{n['rec']}
+            """
+            st.info(narrative)
+            
+            # PDF Export Button (built once per site, narrative and language)
+            try:
+                pdf_data = pdf_report(selected_site, narrative, site_data, tuple(drivers))
+                st.download_button(
+                    label="Download Clinical Study Report (PDF)",
+                    data=pdf_data,
+                    file_name=f"NEST_Report_Site_{selected_site}.pdf",
+                    mime="application/pdf"
+                )
+            except Exception as e:
+                st.error(f"Error generating PDF: {e}")
+
+            drilldown_panel(study, selected_site)
+            
+    else:
+        st.success("No critical operational anomalies detected with current thresholds.")
+
+@st.fragment
+def drilldown_panel(study, selected_site):
+    note_activity()
+    # Subject drill-down: the index maps (site, subject) to row ranges, so only this site's rows are read
+    from subject_index import site_subjects, subject_records
+    st.write(f"#### Subject Drill-down: Site {selected_site}")
+    subjects = site_subjects(study, selected_site)
+    if subjects.empty:
+        st.info("No subject-level records indexed for this site.")
+        return
+    st.dataframe(subjects, use_container_width=True, hide_index=True)
+    subject = st.selectbox("Subject", ["All subjects"] + subjects['Subject'].tolist())
+    records = subject_records(study, selected_site, None if subject == "All subjects" else subject)
+    if records:
+        for tab, (category, frame) in zip(st.tabs(list(records)), records.items()):
+            with tab:
+                st.dataframe(frame, use_container_width=True, hide_index=True)
+
+@st.fragment
+def alert_panel(lang, study, anomalies):
+    note_activity()
+    # Proactive follow-up alerts: persistent outbox + asyncio dispatcher in a background thread (alert_dispatcher.py)
+    st.write("### Proactive Follow-Up Alert System")
+    transport = st.radio("Alert Transport", sorted(TRANSPORTS), horizontal=True,
+                         help="'file' appends to .cache/alert_sink.jsonl; 'smtp' sends through the local relay (ALERT_SMTP_HOST/PORT).")
+    if st.button(lang["push_button"]):
+        queued = enqueue_site_alerts(study, anomalies)
+        started = dispatch_in_background(transport)
+        st.success(f"{queued} alert(s) queued for {len(anomalies)} high-risk site(s); "
+                   f"{len(anomalies) - queued} already alerted today.")
+        if not started:
+            st.info("A delivery run is already in progress; it will pick up the new alerts.")
+    status = outbox_status(study)
+    if not status.empty:
+        st.dataframe(status, use_container_width=True, hide_index=True)
@@ -0,0 +1,60 @@
+"""PDF export for site investigation narratives (FPDF is only loaded when a report is built)."""
+from fpdf import FPDF
+
+# PDF Report Generator Class
+class NESTReport(FPDF):
+    def header(self):
+        self.set_font('Arial', 'B', 15)
+        self.cell(0, 10, 'NEST 2.0: Clinical Study Report Narrative', 0, 1, 'C')
+        self.ln(10)
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Arial', 'I', 8)
+        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+
+def create_pdf_report(site_id, narrative_text, site_data, drivers=()):
+    pdf = NESTReport()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    
+    # Title
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(200, 10, txt=f"Site Investigation Report: {site_id}", ln=True)
+    pdf.ln(5)
+    
+    # Narrative Content
+    pdf.set_font("Arial", size=11)
+    # Cleaning markdown for PDF
+    clean_narrative = narrative_text.replace("**", "").replace("-", "*")
+    pdf.multi_cell(0, 10, txt=clean_narrative)
+    
+    pdf.ln(10)
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(200, 10, txt="Site Metrics Summary", ln=True)
+    pdf.set_font("Arial", size=10)
+    
+    metrics = [
+        f"Country: {site_data['Country']}",
+        f"Region: {site_data['Region']}",
+        f"Query Count: {int(site_data['query_count'])}",
+        f"Missing Pages: {int(site_data['missing_page_count'])}",
+        f"SAE Count: {int(site_data['sae_count'])}",
+        f"Anomaly Score: {round(site_data['anomaly_score'], 4)}"
+    ]
+    
+    for m in metrics:
+        pdf.cell(200, 8, txt=m, ln=True)
+
+    # Per-feature contributions stored with the scores (train_model.explain_scores)
+    contributions = [(c[len('contrib_'):], site_data[c]) for c in site_data.index if c.startswith('contrib_')]
+    if contributions:
+        pdf.ln(5)
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(200, 10, txt="Anomaly Drivers (score contribution)", ln=True)
+        pdf.set_font("Arial", size=10)
+        for feature, value in sorted(contributions, key=lambda x: -x[1]):
+            marker = "*" if feature in drivers else " "
+            pdf.cell(200, 8, txt=f"{marker} {feature}: {value:+.4f} (value {int(site_data[feature])})", ln=True)
+        
+    return pdf.output(dest='S').encode('latin-1')
@@ -0,0 +1,117 @@
+"""Safety Signal Intelligence page (cross-study keyword tracking and pattern discovery)."""
+import os
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+from dataset_catalog import files_by_category, CATALOG_FILE
+from safety_signals import safety_files, expand_terms, search_signals, DEFAULT_QUERY
+from term_index import similar_terms
+from warmup import record_access, note_activity, SEARCH_TARGET
+
+def catalog_version():
+    """Catalog mtime: ingestion and the watcher rewrite it when exports are added or changed."""
+    return os.path.getmtime(CATALOG_FILE) if os.path.exists(CATALOG_FILE) else 0
+
+@st.cache_resource(max_entries=4)
+def get_all_safety_files(root_dir, version):
+    # Safety-relevant workbooks are looked up in the header-signature catalog
+    return safety_files(root_dir)
+
+def render(base_dir):
+    st.title("Safety Signal Intelligence: Discovery Mode")
+    # Access stats drive the warm-up order after a restart (counted once per session)
+    if not st.session_state.get('_counted_search'):
+        record_access(SEARCH_TARGET)
+        st.session_state['_counted_search'] = True
+    st.write("""
+        This engine performs **Cross-Study Signal Detection**. It analyze data patterns in raw clinical reports 
+        to find emerging safety signals (like 'Headache') that are not explicitly labeled.
+    """)
+
+    # --- Mode Selector ---
+    discovery_mode = st.radio("Intelligence Mode", ["Keyword Signal Tracking", "Global Pattern Discovery (Agentic)"], horizontal=True)
+
+    if discovery_mode == "Keyword Signal Tracking":
+        keyword_panel(base_dir)
+    else:
+        discovery_panel(base_dir)
+
+# Each mode is a fragment: typing a query or running the scan reruns only that panel
+# (not app.py, so each one reports the interaction to the warm-up itself)
+
+@st.fragment
+def keyword_panel(base_dir):
+    note_activity()
+    all_safety_files = get_all_safety_files(base_dir, catalog_version())
+    query = st.text_input("Enter a symptom or medical term to track across studies:", DEFAULT_QUERY)
+
+    if query:
+        # Semantic Expansion through the MedDRA/WHODrug term index (term_index.py)
+        expanded = expand_terms(query)
+
+        shown = ', '.join(expanded[1:16]) + (f" and {len(expanded) - 16} more" if len(expanded) > 16 else "")
+        st.caption(f"Gen AI Semantic Expansion: Also searching for {shown or 'no related terms'}")
+        # Typo tolerance: closest indexed spellings by trigram similarity
+        suggestions = [f"{t} ({sim:.0%})" for t, sim in similar_terms(query) if t != query.strip().lower()]
+        if suggestions:
+            st.caption(f"Closest coded/verbatim terms: {', '.join(suggestions)}")
+
+        with st.spinner("Scanning for safety patterns (Deep Scan)..."):
+            master_signals = search_signals(query, all_safety_files)
+
+        if not master_signals.empty:
+            # Signal Density Visualization
+            st.subheader(f"Signal Map for '{query}'")
+            fig_signal = px.histogram(master_signals, x='Study', color='Signal Type', barmode='group',
+                                   title="Clinical Signal Concentration by study")
+            st.plotly_chart(fig_signal, use_container_width=True)
+
+            # Insights
+            top_study = master_signals['Study'].value_counts().idxmax()
+            st.info(f"**AI Interpretation**: The highest signal cluster for `{query}` is located in **{top_study}**. Recommendation: Cross-reference with Site Anomaly scores in the Operational Dashboard.")
+
+            st.write("### Data-Level Evidence")
+            st.dataframe(master_signals)
+        else:
+            st.info("No matching signal patterns found.")
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def portfolio_terms(base_dir, version):
+    """Coded terms from the first 10 MedDRA coding reports, scanned once per catalog version (files_by_category order)."""
+    all_found_terms = []
+    for f in files_by_category("Coding (MedDRA)", root=base_dir)[:10]: # Scan first 10 for performance
+        try:
+            df_tmp = pd.read_excel(f, usecols=['Coded Term'], nrows=500, engine='calamine')
+            all_found_terms.extend(df_tmp['Coded Term'].dropna().tolist())
+        except: continue
+    return all_found_terms
+
+@st.fragment
+def discovery_panel(base_dir):
+    note_activity()
+    st.subheader("Global Medical Pattern Discovery (Top Signals)")
+    st.write("Automatically categorizing clinical terms across ALL reports to find where the 'Headaches' are hiding.")
+
+    if st.button("Run Agentic Signal Scan (Full Portfolio)"):
+        with st.spinner("Processing portofolio-wide safety signals..."):
+            # Simulation of a high-power pattern recognizer
+            # We extract the most common coding patterns from the MedDRA reports
+            all_found_terms = portfolio_terms(base_dir, catalog_version())
+
+            if all_found_terms:
+                term_counts = pd.Series(all_found_terms).value_counts().head(10).reset_index()
+                term_counts.columns = ['Medical Pattern', 'Occurrence']
+
+                st.write("### Portfolio-Wide Safety Heatmap")
+                fig_global = px.treemap(term_counts, path=['Medical Pattern'], values='Occurrence',
+                                     color='Occurrence', color_continuous_scale='Reds')
+                st.plotly_chart(fig_global, use_container_width=True)
+
+                st.success("Successfully identified clinical hotspots across the database.")
+
+                # Highlight 'Headache' specifically if found in patterns
+                headache_patterns = [t for t in all_found_terms if "headache" in str(t).lower()]
+                if headache_patterns:
+                    st.warning(f"⚠️ FOUND: Hidden 'Headache' patterns detected {len(headache_patterns)} times in the global portfolio data, even when not explicitly searched for.")
+                else:
+                    st.info("No dominant 'Headache' patterns found in the global scan. The data appears stable.")
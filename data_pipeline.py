@@ -2,6 +2,11 @@ import pandas as pd
 import numpy as np
 import os
 from concurrent.futures import ThreadPoolExecutor
+from site_dictionary import canonical_site_ids, site_keys, load_dictionary, apply_site_dtypes
+from dataset_catalog import study_files, workbook_layout, layout_key, stored_layout_key, store_layout_key
+from edc_delta import apply_edc_delta
+from visit_backlog import site_visit_features
+from file_locks import atomic_path
 
 def find_column(df, patterns):
     """
@@ -37,43 +42,62 @@ def find_column(df, patterns):
                         return col
     return None
 
+def _read_sheet(file_path, sheet, header_row, patterns, metric_name):
+    """One sheet of a report: the whole sheet for EDC, the site (and country) columns otherwise."""
+    # Header scan
+    head = pd.read_excel(file_path, sheet_name=sheet, header=header_row, nrows=0, engine='calamine')
+    head.columns = [str(c) for c in head.columns]
+    cols = []
+
+    if metric_name == "edc":
+        s_col = find_column(head, ['Site ID', 'Site number', 'Site', 'SITE'])
+        c_col = find_column(head, ['Country', 'COUNTRY'])
+        r_col = find_column(head, ['Region', 'REGION'])
+
+        # Robust Selection: Only use columns that exist (a column matched twice keeps its first role)
+        rename_map = {}
+        for col, target in ((s_col, 'Site ID'), (c_col, 'Country'), (r_col, 'Region')):
+            if col and col not in rename_map:
+                cols.append(col)
+                rename_map[col] = target
+
+        if cols:
+            # Whole rows are kept: the CDC stage (edc_delta.py) fingerprints every column
+            df = pd.read_excel(file_path, sheet_name=sheet, header=header_row, engine='calamine')
+            return df.rename(columns=rename_map)
+
+    else: # Missing or SAE
+        s_col = find_column(head, patterns)
+        c_col = find_column(head, ['Country', 'COUNTRY'])
+        if s_col:
+            # The site column keeps its role when the country lookup lands on the same column
+            rename_map = {s_col: 'Site ID'}
+            if c_col and c_col != s_col:
+                rename_map[c_col] = 'Country'
+            df = pd.read_excel(file_path, sheet_name=sheet, header=header_row, usecols=list(rename_map), engine='calamine')
+            return df.rename(columns=rename_map)
+    return pd.DataFrame()
+
 def optimized_excel_read(file_path, patterns, study_name, metric_name):
-    """Reads only required columns from a specific Excel file using Calamine."""
+    """
+    Reads only required columns from a specific Excel file using Calamine.
+    The sheets and header rows come from the workbook's detected layout (title rows
+    skipped, every relevant sheet read in parallel, e.g. SAE DM and Safety queues).
+    """
     if not file_path or not os.path.exists(file_path):
         return pd.DataFrame()
-    
+
     try:
-        # Header scan
-        head = pd.read_excel(file_path, nrows=0, engine='calamine')
-        cols = []
-        
-        if metric_name == "edc":
-            s_col = find_column(head, ['Site ID', 'Site number', 'Site', 'SITE'])
-            c_col = find_column(head, ['Country', 'COUNTRY'])
-            r_col = find_column(head, ['Region', 'REGION'])
-            
-            # Robust Selection: Only use columns that exist
-            rename_map = {}
-            if s_col: 
-                cols.append(s_col)
-                rename_map[s_col] = 'Site ID'
-            if c_col: 
-                cols.append(c_col)
-                rename_map[c_col] = 'Country'
-            if r_col: 
-                cols.append(r_col)
-                rename_map[r_col] = 'Region'
-            
-            if cols:
-                df = pd.read_excel(file_path, usecols=cols, engine='calamine')
-                return df.rename(columns=rename_map)
-                
-        else: # Missing or SAE
-            s_col = find_column(head, patterns)
-            if s_col:
-                df = pd.read_excel(file_path, usecols=[s_col], engine='calamine')
-                return df.rename(columns={s_col: 'Site ID'})
-                
+        layout = workbook_layout(file_path)
+        if len(layout) == 1:
+            frames = [_read_sheet(file_path, *layout[0], patterns, metric_name)]
+        else:
+            with ThreadPoolExecutor(max_workers=len(layout)) as executor:
+                frames = list(executor.map(lambda sheet: _read_sheet(file_path, *sheet, patterns, metric_name), layout))
+        frames = [f for f in frames if not f.empty]
+        if frames:
+            return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
     except Exception as e:
         # Log to activity log instead of just printing
         log_msg = f"Error reading {metric_name} in {study_name}: {e}\n"
@@ -95,39 +119,24 @@ def load_and_preprocess_data(study_folder="STUDY 21_CPID_Input Files - Anonymiza
     if not os.path.exists(base_path):
         return pd.DataFrame()
 
-    # Dynamic File Finding
-    files = [os.path.join(base_path, f) for f in os.listdir(base_path) if f.endswith(".xlsx")]
-    if not files: return pd.DataFrame()
-    
-    # Check Cache Validity
+    # File identification (Problem 1: Robust Selection) - looked up in the header-signature catalog
+    roles = study_files(study_folder)
+    edc_metrics_file = roles.get('EDC Metrics')
+    missing_pages_file = roles.get('Missing Pages')
+    sae_file = roles.get('SAE Dashboard')
+    if not any([edc_metrics_file, missing_pages_file, sae_file]): return pd.DataFrame()
+
+    # Check Cache Validity (the workbooks this table is built from, and the sheet layouts read from them)
+    files = [f for f in (edc_metrics_file, missing_pages_file, sae_file, roles.get('Visit Tracker')) if f]
+    layout = layout_key([f for f in (edc_metrics_file, missing_pages_file, sae_file) if f])
     if os.path.exists(cache_file):
         cache_time = os.path.getmtime(cache_file)
-        if all(os.path.getmtime(f) < cache_time for f in files if os.path.exists(f)):
-            print(f"Loading Study {study_folder} from High-Speed Binary Cache...")
-            return pd.read_csv(cache_file)
-
-    # File identification (Problem 1: Robust Selection)
-    edc_metrics_file = None
-    missing_pages_file = None
-    sae_file = None
-
-    for f in files:
-        f_low = f.lower().replace("_", " ") # Normalize underscores to spaces
-        if "edc metrics" in f_low or "edc" in f_low: 
-            # Prioritize "metrics" if both are present
-            if "edc" in f_low and "metrics" in f_low: 
-                edc_metrics_file = f
-                continue # Strong match
-            if not edc_metrics_file: edc_metrics_file = f
-            
-        elif "missing" in f_low and "pages" in f_low: 
-            missing_pages_file = f
-        elif "sae" in f_low: 
-            sae_file = f
-
-    # Fallback for EDC if not explicitly named
-    if not edc_metrics_file and files: 
-        edc_metrics_file = files[0]
+        if all(os.path.getmtime(f) < cache_time for f in files if os.path.exists(f)) and stored_layout_key(cache_file) == layout:
+            cached = pd.read_csv(cache_file)
+            # Caches written before the site dimension / visit features existed are rebuilt
+            if {'site_key', 'overdue_visit_count'} <= set(cached.columns):
+                print(f"Loading Study {study_folder} from High-Speed Binary Cache...")
+                return apply_site_dtypes(cached)
 
     log_msg = f"Parallel Processing Study {study_folder} (Calamine Engine)...\n"
     with open(os.path.join(BASE_DIR, "activity_log.txt"), "a") as f:
@@ -136,39 +145,65 @@ def load_and_preprocess_data(study_folder="STUDY 21_CPID_Input Files - Anonymiza
     # Run parallel loads
     with ThreadPoolExecutor(max_workers=3) as executor:
         f_edc = executor.submit(optimized_excel_read, edc_metrics_file, [], study_folder, "edc")
-        f_missing = executor.submit(optimized_excel_read, missing_pages_file, ['Site number', 'Site', 'SITE'], study_folder, "missing")
+        f_missing = executor.submit(optimized_excel_read, missing_pages_file, ['SiteNumber', 'Site number', 'Site', 'SITE'], study_folder, "missing")
         f_sae = executor.submit(optimized_excel_read, sae_file, ['Site ID', 'Site No', 'Site', 'SITE'], study_folder, "sae")
         
         df_edc = f_edc.result()
         df_m = f_missing.result()
         df_s = f_sae.result()
 
-    # Aggregate EDC
+    if df_edc.empty and df_m.empty and df_s.empty:
+        return pd.DataFrame()
+
+    # Site dimension: canonical ids -> stable int32 surrogate keys, so every join is an integer join
+    for frame in (df_m, df_s):
+        if not frame.empty:
+            frame['Site ID'] = canonical_site_ids(frame['Site ID'])
+            frame.dropna(subset=['Site ID'], inplace=True)
+            frame['site_key'] = site_keys(study_folder, frame['Site ID']).astype('int32')
+
+    # Aggregate EDC (studies shipped without an EDC Metrics export still get a site table from the other reports)
     if not df_edc.empty:
-        # Problem 1: Agentic Schema Harmonization
-        available_cols = [c for c in ['Site ID', 'Country', 'Region'] if c in df_edc.columns]
-        site_info = df_edc[available_cols].drop_duplicates().dropna(subset=['Site ID'])
-        site_queries = df_edc.groupby('Site ID').size().reset_index(name='query_count')
-        site_data = site_queries.merge(site_info, on='Site ID', how='left')
+        # Problem 1: Agentic Schema Harmonization - only rows changed since the previous export are re-counted
+        site_data = apply_edc_delta(study_folder, df_edc)
     else:
-        return pd.DataFrame()
+        site_data = pd.DataFrame({'Site ID': pd.Series(dtype=object), 'query_count': pd.Series(dtype='int32')}, index=pd.Index([], dtype='int32', name='site_key'))
 
     # Aggregate Missing
-    site_missing = df_m.groupby('Site ID').size().reset_index(name='missing_page_count') if not df_m.empty else pd.DataFrame(columns=['Site ID', 'missing_page_count'])
+    site_missing = df_m.groupby('site_key').size().rename('missing_page_count') if not df_m.empty else pd.Series(name='missing_page_count', dtype='int32')
     
     # Aggregate SAE
-    site_sae = df_s.groupby('Site ID').size().reset_index(name='sae_count') if not df_s.empty else pd.DataFrame(columns=['Site ID', 'sae_count'])
+    site_sae = df_s.groupby('site_key').size().rename('sae_count') if not df_s.empty else pd.Series(name='sae_count', dtype='int32')
 
-    # Merge
-    final_df = site_data.merge(site_missing, on='Site ID', how='outer').merge(site_sae, on='Site ID', how='outer')
+    # Merge on the integer key; sites seen only in Missing/SAE reports take their label from the dictionary
+    final_df = site_data.join([site_missing, site_sae], how='outer')
+    site_dim = load_dictionary()
+    site_dim = site_dim[site_dim['Study'] == study_folder].set_index('site_key')['Site ID']
+    final_df['Site ID'] = final_df['Site ID'].fillna(site_dim)
+    final_df = final_df.rename_axis('site_key').reset_index()
     
     # Defaults for missing metadata
-    if 'Country' not in final_df.columns: final_df['Country'] = 'Unknown'
+    if 'Country' not in final_df.columns: final_df['Country'] = np.nan
     if 'Region' not in final_df.columns: final_df['Region'] = 'Global'
-    final_df.fillna(0, inplace=True)
+    # Country backfilled from the Missing/SAE reports for sites the EDC export doesn't list
+    for frame in (df_m, df_s):
+        if not frame.empty and 'Country' in frame.columns:
+            known = frame[frame['Country'].notna() & (frame['Country'].astype(str).str.strip() != '')]
+            known = known.drop_duplicates('site_key').set_index('site_key')['Country']
+            final_df['Country'] = final_df['Country'].fillna(final_df['site_key'].map(known))
+    final_df['Country'] = final_df['Country'].fillna('Unknown')
+    final_df['Region'] = final_df['Region'].fillna('Global')
+
+    # Visit backlog features (visit_backlog.py); sites without overdue visits get 0
+    final_df = final_df.join(site_visit_features(study_folder), on='site_key')
+    final_df = apply_site_dtypes(final_df)
+    final_df = final_df[['Site ID', 'site_key', 'query_count', 'Country', 'Region', 'missing_page_count', 'sae_count',
+                         'overdue_visit_count', 'max_days_overdue']]
     
-    # Cache it
-    final_df.to_csv(cache_file, index=False)
+    # Cache it (replaced in one step: the query service reads it from another process)
+    with atomic_path(cache_file) as tmp:
+        final_df.to_csv(tmp, index=False)
+    store_layout_key(cache_file, layout)
     return final_df
 
 if __name__ == "__main__":
@@ -0,0 +1,278 @@
+import pandas as pd
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from python_calamine import CalamineWorkbook
+from file_locks import file_lock, atomic_path
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STUDY_ROOT = os.path.join(BASE_DIR, "QC Anonymized Study Files")
+CATALOG_FILE = os.path.join(BASE_DIR, "dataset_inventory.csv")
+LAYOUT_FILE = os.path.join(BASE_DIR, ".cache", "sheet_layouts.json")
+
+CATALOG_COLUMNS = ['Study', 'File', 'Category', 'Size (MB)', 'Sample Columns', 'Header Row', 'Modified']
+
+# Header signatures: a workbook belongs to a category when every token of any one
+# token set appears (as a substring) in some cell of its header row.
+HEADER_SIGNATURES = [
+    ('EDC Metrics', [['project name', 'site id', 'subject id']]),
+    ('Data Review (EDRR)', [['total open issue count']]),
+    ('Coding (MedDRA)', [['meddra coding report']]),
+    ('Coding (WHODD)', [['whodrug coding report']]),
+    ('SAE Dashboard', [['discrepancy id', 'review status']]),
+    ('Missing Pages', [['sitegroupname', 'sitenumber'], ['page name', 'visit']]),
+    ('Lab/Range Report', [['lab date', 'test name']]),
+    ('Visit Tracker', [['# days outstanding']]),
+    ('Inactivated Records', [['audit action']]),
+]
+
+# Used only when no header row matches a signature (e.g. an unfamiliar template)
+FILENAME_HINTS = [
+    ('EDC Metrics', ['edc metrics', 'edc']),
+    ('Coding (MedDRA)', ['meddra', 'medra']),
+    ('Coding (WHODD)', ['whodd', 'whodrug', 'whodra']),
+    ('SAE Dashboard', ['sae']),
+    ('Missing Pages', ['missing pages', 'missing page']),
+    ('Data Review (EDRR)', ['edrr']),
+    ('Lab/Range Report', ['lab name', 'lnr']),
+    ('Visit Tracker', ['visit projection', 'missing visit']),
+    ('Inactivated Records', ['inactivated']),
+]
+
+HEADER_SCAN_ROWS = 10
+
+# Categories whose sheets hold disjoint record sets (SAE Dashboard: DM and Safety review
+# queues). Elsewhere the first matching sheet is authoritative: Missing Pages' visit-level
+# sheet repeats rows of 'All Pages Missing', and EDC Metrics' other sheets are other reports.
+MULTI_SHEET_CATEGORIES = {'SAE Dashboard'}
+
+_lock = threading.Lock()
+_layouts = {'mtime': None, 'layouts': {}}
+
+def classify_header(rows, file_name=""):
+    """
+    Problem 1 (Robust Selection): classifies a workbook by the signature of its header row.
+    Scans the first rows so title banners above the real header don't hide it.
+    Returns (category, header_row_index, header_cells).
+    """
+    for idx, row in enumerate(rows):
+        cells = [str(c).strip().lower() for c in row if str(c).strip()]
+        for category, token_sets in HEADER_SIGNATURES:
+            for tokens in token_sets:
+                if all(any(t in c for c in cells) for t in tokens):
+                    return category, idx, [str(c).strip() for c in row]
+
+    f_low = file_name.lower().replace("_", " ")
+    for category, hints in FILENAME_HINTS:
+        if any(h in f_low for h in hints):
+            return category, 0, [str(c).strip() for c in rows[0]] if rows else []
+    return 'Other', 0, [str(c).strip() for c in rows[0]] if rows else []
+
+def scan_workbook(path):
+    """Reads only the top rows of the first sheet and classifies the workbook."""
+    try:
+        sheet = CalamineWorkbook.from_path(path).get_sheet_by_index(0)
+        rows = sheet.to_python(nrows=HEADER_SCAN_ROWS)
+    except Exception:
+        rows = []
+    category, header_row, header = classify_header(rows, os.path.basename(path))
+    stat = os.stat(path)
+    return {
+        'Study': os.path.basename(os.path.dirname(path)),
+        'File': os.path.basename(path),
+        'Category': category,
+        'Size (MB)': round(stat.st_size / (1024 * 1024), 2),
+        'Sample Columns': ", ".join(c for c in header[:5]),
+        'Header Row': header_row,
+        'Modified': stat.st_mtime,
+    }
+
+def detect_layout(path, category):
+    """
+    Samples the top rows of every sheet and returns [(sheet_index, header_row)] for the
+    sheets whose header matches the workbook's category (all of them for multi-sheet
+    categories, else the first). Falls back to the first sheet's top row.
+    """
+    workbook = CalamineWorkbook.from_path(path)
+    sheets = []
+    for idx, name in enumerate(workbook.sheet_names):
+        rows = workbook.get_sheet_by_name(name).to_python(nrows=HEADER_SCAN_ROWS)
+        found, header_row, _ = classify_header(rows)
+        if found == category:
+            sheets.append((idx, header_row))
+    if not sheets:
+        return [(0, 0)]
+    return sheets if category in MULTI_SHEET_CATEGORIES else sheets[:1]
+
+def _load_layouts():
+    mtime = os.path.getmtime(LAYOUT_FILE) if os.path.exists(LAYOUT_FILE) else None
+    if _layouts['mtime'] != mtime:
+        if mtime is None:
+            _layouts.update({'mtime': None, 'layouts': {}})
+        else:
+            with open(LAYOUT_FILE) as f:
+                _layouts.update({'mtime': mtime, 'layouts': json.load(f)})
+    return _layouts['layouts']
+
+def _signature(category, header_row, sample_columns):
+    return f"{category}|{int(header_row)}|{sample_columns}"
+
+def workbook_layout(path, learn=True):
+    """
+    Problem 1 (Robust Selection): the sheets and header rows to read from a workbook, as
+    [(sheet_index, header_row)]. Layouts are detected once per header signature (category,
+    header row and leading header cells from the catalog) and cached in LAYOUT_FILE, so
+    later exports of a known template skip the per-sheet sampling. With learn=False an
+    unknown template is detected without being stored (read-only callers).
+    """
+    study, name = os.path.basename(os.path.dirname(path)), os.path.basename(path)
+    catalog = load_catalog()
+    entry = catalog[(catalog['Study'] == study) & (catalog['File'] == name)]
+    entry = entry.iloc[0] if not entry.empty else pd.Series(scan_workbook(path))
+    signature = _signature(entry['Category'], entry['Header Row'], entry['Sample Columns'])
+
+    with _lock:
+        layout = _load_layouts().get(signature)
+    if layout is not None:
+        return [tuple(sheet) for sheet in layout]
+
+    layout = detect_layout(path, entry['Category'])
+    if not learn:
+        return layout
+    with _lock, file_lock("sheet_layouts"):
+        layouts = dict(_load_layouts())
+        layouts[signature] = layout
+        with atomic_path(LAYOUT_FILE) as tmp:
+            with open(tmp, "w") as f:
+                json.dump(layouts, f, indent=1)
+    with open(os.path.join(BASE_DIR, "activity_log.txt"), "a") as f:
+        f.write(f"Sheet layout learned for {entry['Category']} template ({name}): {layout}\n")
+    return layout
+
+def layout_keys(paths, learn=True):
+    """
+    {path: short hash of the workbook's sheet layout}. A cache built from workbooks stores
+    their keys and is rebuilt when one changes, so learning a new template's layout only
+    invalidates the caches of the workbooks that use it.
+    """
+    catalog = load_catalog()
+    signatures = {(s, f): (c, h, cols) for s, f, c, h, cols in
+                  zip(catalog['Study'], catalog['File'], catalog['Category'], catalog['Header Row'], catalog['Sample Columns'])}
+    with _lock:
+        layouts = _load_layouts()
+    keys = {}
+    for path in paths:
+        try:
+            entry = signatures.get((os.path.basename(os.path.dirname(path)), os.path.basename(path)))
+            layout = layouts.get(_signature(*entry)) if entry else None
+            if layout is None:
+                layout = workbook_layout(path, learn)
+        except Exception:
+            layout = None
+        keys[path] = hashlib.sha1(json.dumps(layout, default=int).encode()).hexdigest()[:12]
+    return keys
+
+def layout_key(paths):
+    """One key over the sheet layouts of several workbooks (a cache built from all of them)."""
+    keys = layout_keys(paths)
+    return hashlib.sha1("|".join(keys[p] for p in sorted(keys)).encode()).hexdigest()[:12]
+
+def stored_layout_key(cache_path):
+    """Layout key a cache file was built with (kept next to it), or None."""
+    try:
+        with open(f"{cache_path}.layout") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def store_layout_key(cache_path, key):
+    with atomic_path(f"{cache_path}.layout") as tmp:
+        with open(tmp, "w") as f:
+            f.write(key)
+
+def load_catalog():
+    if not os.path.exists(CATALOG_FILE):
+        return pd.DataFrame(columns=CATALOG_COLUMNS)
+    catalog = pd.read_csv(CATALOG_FILE)
+    for col in CATALOG_COLUMNS:
+        if col not in catalog.columns:
+            catalog[col] = None
+    return catalog[CATALOG_COLUMNS]
+
+def _list_workbooks(root, studies=None):
+    found = []
+    if not os.path.exists(root):
+        return found
+    for study in sorted(os.listdir(root)):
+        study_path = os.path.join(root, study)
+        if not os.path.isdir(study_path) or (studies is not None and study not in studies):
+            continue
+        for f in sorted(os.listdir(study_path)):
+            if f.endswith(".xlsx") and not f.startswith("~$"):
+                found.append(os.path.join(study_path, f))
+    return found
+
+def refresh_catalog(studies=None, root=STUDY_ROOT, max_workers=8):
+    """
+    Brings the catalog up to date with the study folders.
+    Only new or modified workbooks have their headers scanned (in parallel); entries for
+    deleted files are dropped. `studies` limits the refresh to a subset of study folders.
+    """
+    with _lock, file_lock("dataset_catalog"):
+        catalog = load_catalog()
+        paths = _list_workbooks(root, studies)
+        known = {(r['Study'], r['File']): r['Modified'] for _, r in catalog.iterrows()}
+
+        stale = []
+        for p in paths:
+            key = (os.path.basename(os.path.dirname(p)), os.path.basename(p))
+            modified = known.get(key)
+            if modified is None or pd.isna(modified) or float(modified) != os.path.getmtime(p):
+                stale.append(p)
+
+        in_scope = catalog['Study'].isin(studies) if studies is not None else pd.Series(True, index=catalog.index)
+        present = {(os.path.basename(os.path.dirname(p)), os.path.basename(p)) for p in paths}
+        removed = in_scope & ~pd.Series([(s, f) in present for s, f in zip(catalog['Study'], catalog['File'])], index=catalog.index, dtype=bool)
+
+        if not stale and not removed.any():
+            return catalog
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            scanned = pd.DataFrame(list(executor.map(scan_workbook, stale)), columns=CATALOG_COLUMNS)
+
+        stale_keys = set(zip(scanned['Study'], scanned['File']))
+        keep = ~removed & ~pd.Series([(s, f) in stale_keys for s, f in zip(catalog['Study'], catalog['File'])], index=catalog.index, dtype=bool)
+        frames = [f.dropna(axis=1, how='all') for f in (catalog[keep], scanned) if not f.empty]
+        catalog = pd.concat(frames, ignore_index=True).reindex(columns=CATALOG_COLUMNS) if frames else pd.DataFrame(columns=CATALOG_COLUMNS)
+        catalog = catalog.sort_values(['Study', 'File']).reset_index(drop=True)
+        with atomic_path(CATALOG_FILE) as tmp:
+            catalog.to_csv(tmp, index=False)
+
+    log_msg = f"Dataset catalog refreshed: {len(stale)} workbook(s) scanned, {int(removed.sum())} removed.\n"
+    with open(os.path.join(BASE_DIR, "activity_log.txt"), "a") as f:
+        f.write(log_msg)
+    return catalog
+
+def study_files(study_folder, root=STUDY_ROOT):
+    """
+    Returns {category: path} for one study, refreshing that study's catalog entries first.
+    When a study holds several workbooks of one category, the most recent export wins.
+    """
+    catalog = refresh_catalog([study_folder], root=root)
+    rows = catalog[catalog['Study'] == study_folder].sort_values('Modified')
+    return {r['Category']: os.path.join(root, study_folder, r['File']) for _, r in rows.iterrows()}
+
+def files_by_category(category, root=STUDY_ROOT, refresh=True):
+    """
+    All catalogued workbooks of one category across the portfolio. Readers that must not
+    scan folders (the query service) pass refresh=False and take the catalog as stored.
+    """
+    catalog = refresh_catalog(root=root) if refresh else load_catalog()
+    rows = catalog[catalog['Category'] == category]
+    return [os.path.join(root, s, f) for s, f in zip(rows['Study'], rows['File'])]
+
+if __name__ == "__main__":
+    catalog = refresh_catalog()
+    print(catalog['Category'].value_counts().to_string())
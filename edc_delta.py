@@ -0,0 +1,99 @@
+import pandas as pd
+import numpy as np
+import os
+from site_dictionary import canonical_site_ids, site_keys
+from file_locks import atomic_path
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_DIR = os.path.join(BASE_DIR, ".cache", "edc_state")
+
+# Stable identifiers of an EDC Metrics row (matched exactly, whichever the export carries)
+ROW_KEY_COLUMNS = ['subject id', 'subject', 'form oid', 'form', 'logline', 'query id', 'discrepancy id']
+
+SITE_COLUMNS = ['Site ID', 'Country', 'Region']
+
+def _state_paths(study):
+    slug = study.replace(' ', '_')
+    return os.path.join(STATE_DIR, f"{slug}_rows.parquet"), os.path.join(STATE_DIR, f"{slug}_sites.parquet")
+
+def fingerprint_rows(df):
+    """
+    Fingerprints each export row: `row_key` hashes the stable identifiers (site, subject,
+    form, query ids plus an ordinal for repeated keys), `row_hash` hashes the whole row.
+    """
+    key_cols = ['Site ID'] + [c for c in df.columns if str(c).strip().lower() in ROW_KEY_COLUMNS]
+    keys = df[key_cols].astype(str)
+    keys['__ordinal'] = keys.groupby(key_cols).cumcount()
+    return pd.DataFrame({
+        'row_key': pd.util.hash_pandas_object(keys, index=False).to_numpy(),
+        'row_hash': pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy(),
+    }, index=df.index)
+
+def load_state(study):
+    rows_file, sites_file = _state_paths(study)
+    if not (os.path.exists(rows_file) and os.path.exists(sites_file)):
+        return None, None
+    return pd.read_parquet(rows_file), pd.read_parquet(sites_file).set_index('site_key')
+
+def diff_exports(previous, current):
+    """Splits two fingerprint tables into inserted, removed and changed rows (joined on row_key)."""
+    merged = previous.merge(current, on='row_key', how='outer', suffixes=('_old', '_new'), indicator=True)
+    inserted = merged[merged['_merge'] == 'right_only']
+    removed = merged[merged['_merge'] == 'left_only']
+    changed = merged[(merged['_merge'] == 'both') & (merged['row_hash_old'] != merged['row_hash_new'])]
+    return inserted, removed, changed
+
+def apply_edc_delta(study, df_edc):
+    """
+    Change-data-capture stage for EDC Metrics exports.
+    Diffs the new export against the fingerprints of the previous one and applies only the
+    inserted, removed and changed rows to the stored per-site aggregates. Returns the site
+    table (Site ID, Country, Region, query_count) indexed by site_key.
+    """
+    df = df_edc.copy()
+    df['Site ID'] = canonical_site_ids(df['Site ID'])
+    df = df.dropna(subset=['Site ID']).reset_index(drop=True)
+    df['site_key'] = site_keys(study, df['Site ID']).astype('int32')
+
+    current = fingerprint_rows(df.drop(columns='site_key'))
+    current['site_key'] = df['site_key'].to_numpy()
+
+    previous, sites = load_state(study)
+    if previous is None:
+        previous = current.iloc[0:0]
+        sites = pd.DataFrame({'query_count': pd.Series(dtype='int32')}, index=pd.Index([], dtype='int32', name='site_key'))
+
+    inserted, removed, changed = diff_exports(previous, current)
+
+    # Count deltas: inserted rows add to their site, removed rows subtract, changed rows move between sites
+    delta = pd.concat([
+        pd.Series(1, index=inserted['site_key_new'].astype('int32')),
+        pd.Series(-1, index=removed['site_key_old'].astype('int32')),
+        pd.Series(-1, index=changed['site_key_old'].astype('int32')),
+        pd.Series(1, index=changed['site_key_new'].astype('int32')),
+    ]).groupby(level=0).sum()
+    counts = sites['query_count'].reindex(sites.index.union(delta.index), fill_value=0).add(delta, fill_value=0)
+
+    # Site labels refreshed from the touched rows only
+    touched_keys = pd.Index(np.concatenate([inserted['row_key'].to_numpy(), changed['row_key'].to_numpy()]))
+    touched = df[current['row_key'].isin(touched_keys)]
+    info = sites.drop(columns='query_count').reindex(counts.index)
+    if not touched.empty:
+        labels = touched[['site_key'] + [c for c in SITE_COLUMNS if c in touched.columns]].drop_duplicates('site_key', keep='last').set_index('site_key')
+        info = labels.combine_first(info) if not info.empty else labels.reindex(counts.index)
+
+    site_table = info.reindex(counts.index)
+    site_table['query_count'] = counts.astype('int32')
+    site_table = site_table[site_table['query_count'] > 0].rename_axis('site_key')
+
+    if len(inserted) or len(removed) or len(changed) or previous.empty:
+        rows_file, sites_file = _state_paths(study)
+        with atomic_path(rows_file) as tmp:
+            current.to_parquet(tmp, index=False)
+        with atomic_path(sites_file) as tmp:
+            site_table.reset_index().to_parquet(tmp, index=False)
+
+        log_msg = f"EDC delta for {study}: +{len(inserted)} inserted, -{len(removed)} removed, ~{len(changed)} changed rows.\n"
+        with open(os.path.join(BASE_DIR, "activity_log.txt"), "a") as f:
+            f.write(log_msg)
+    return site_table
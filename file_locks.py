@@ -0,0 +1,72 @@
+"""
+Cross-process locks and atomic writes for the shared caches in .cache/.
+The dashboard, the watch-folder daemon and the query service run as separate processes
+over the same files (site dictionary, rollup cube, catalog, EDC state, snapshots, subject
+index). Read-modify-write updates hold a named lock file; every cache file is written to a
+temporary file first and moved into place, so readers see the old or the new file, never
+a partial one.
+"""
+import os
+import threading
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOCK_DIR = os.path.join(BASE_DIR, ".cache", "locks")
+
+# Locks already held by this thread (re-entering a held lock must not block on itself)
+_held = threading.local()
+
+@contextlib.contextmanager
+def file_lock(name):
+    """Exclusive lock shared by every thread and process of the platform, by name."""
+    held = _held.__dict__.setdefault('names', {})
+    if held.get(name):
+        held[name] += 1
+        try:
+            yield
+        finally:
+            held[name] -= 1
+        return
+
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    with open(os.path.join(LOCK_DIR, f"{name}.lock"), "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        held[name] = 1
+        try:
+            yield
+        finally:
+            held[name] = 0
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+@contextlib.contextmanager
+def atomic_path(path):
+    """
+    Yields a temporary path next to `path`; once the block completes it replaces `path`
+    in one step. On error the temporary file is removed and `path` is left untouched.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
@@ -0,0 +1,211 @@
+"""
+Read-only HTTP/JSON query service over the shared caches.
+Serves precomputed site scores, visit backlogs, score trends, rollups and safety-search
+results (from the stored catalog, term index and cached safety rows) without running
+ingestion, folder scans or model training. Responses carry an ETag derived from
+the backing cache files, so clients polling with If-None-Match get 304 until data changes.
+List endpoints are paginated with ?limit=&offset=.
+
+    python query_service.py [--host 127.0.0.1] [--port 8765]
+
+    GET /health
+    GET /studies
+    GET /studies/{study}/sites?anomalies=true
+    GET /studies/{study}/visits
+    GET /studies/{study}/trend?metric=query_count
+    GET /rollup/{level}?study=&region=&country=
+    GET /safety/search?q=headache
+    GET /terms/similar?q=headach&k=10
+"""
+import os
+import json
+import hashlib
+import argparse
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from dataset_catalog import STUDY_ROOT
+from study_ingest import scored_path
+from risk_rollup import rollup_lookup, LEVELS, CUBE_FILE
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+_memo = {}
+
+def _file_version(*paths):
+    """Cache token of the files behind a response (missing files count as absent)."""
+    parts = []
+    for p in paths:
+        try:
+            stat = os.stat(p)
+            parts.append(f"{p}:{stat.st_mtime_ns}:{stat.st_size}")
+        except OSError:
+            parts.append(f"{p}:-")
+    return "|".join(parts)
+
+def _read_scores(study):
+    """Scored site table of one study from the per-study cache, memoized on mtime."""
+    path = scored_path(study)
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    if _memo.get(path, (None,))[0] != mtime:
+        _memo[path] = (mtime, pd.read_csv(path))
+    return _memo[path][1]
+
+def _page_params(request):
+    try:
+        limit = int(request.query_params.get('limit', DEFAULT_PAGE_SIZE))
+        offset = int(request.query_params.get('offset', 0))
+    except ValueError:
+        return None
+    if limit < 1 or offset < 0:
+        return None
+    return min(limit, MAX_PAGE_SIZE), offset
+
+async def _respond(request, version, build):
+    """
+    Conditional, paginated JSON response. `build` (run in a worker thread) returns a
+    DataFrame, or None for 404; it is skipped entirely when the client's ETag matches.
+    """
+    params = _page_params(request)
+    if params is None:
+        return JSONResponse({'error': 'limit must be >= 1 and offset >= 0'}, status_code=400)
+    limit, offset = params
+
+    etag = 'W/"' + hashlib.sha1(f"{request.url.path}?{request.url.query}|{version}".encode()).hexdigest()[:20] + '"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag in [t.strip() for t in request.headers.get('if-none-match', '').split(',')]:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        frame = await run_in_threadpool(build)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    if frame is None:
+        return JSONResponse({'error': 'not found (has this study been ingested?)'}, status_code=404)
+
+    total = len(frame)
+    page = frame.iloc[offset:offset + limit]
+    next_offset = offset + limit if offset + limit < total else None
+    body = (f'{{"total": {total}, "limit": {limit}, "offset": {offset}, "next_offset": {json.dumps(next_offset)}, '
+            f'"items": {page.to_json(orient="records", date_format="iso")}}}')
+    return Response(body, media_type='application/json', headers=headers)
+
+async def health(request):
+    return JSONResponse({'status': 'ok'})
+
+async def studies(request):
+    folders = sorted(d for d in os.listdir(STUDY_ROOT) if os.path.isdir(os.path.join(STUDY_ROOT, d))) if os.path.exists(STUDY_ROOT) else []
+    paths = [scored_path(s) for s in folders]
+
+    def build():
+        rows = []
+        for study in folders:
+            scored = _read_scores(study)
+            if scored is not None:
+                rows.append({'study': study, 'sites': len(scored), 'anomalies': int((scored['is_anomaly'] == -1).sum()),
+                             'scored_at': pd.Timestamp.fromtimestamp(os.path.getmtime(scored_path(study))).isoformat()})
+        return pd.DataFrame(rows, columns=['study', 'sites', 'anomalies', 'scored_at'])
+    return await _respond(request, _file_version(*paths), build)
+
+async def study_sites(request):
+    study = request.path_params['study']
+    anomalies_only = request.query_params.get('anomalies', '').lower() in ('1', 'true', 'yes')
+
+    def build():
+        scored = _read_scores(study)
+        if scored is None:
+            return None
+        if anomalies_only:
+            scored = scored[scored['is_anomaly'] == -1]
+        return scored.sort_values('anomaly_score')
+    return await _respond(request, _file_version(scored_path(study)), build)
+
+async def study_visits(request):
+    from visit_backlog import site_backlog, VISITS_CACHE
+    study = request.path_params['study']
+
+    def build():
+        # The cached table as it is: the watcher and the dashboard rebuild it, never this service
+        backlog = site_backlog(study, refresh=False)
+        return backlog.sort_values('overdue_visit_count', ascending=False) if not backlog.empty else None
+    return await _respond(request, _file_version(VISITS_CACHE), build)
+
+async def study_trend(request):
+    from snapshot_store import load_history, SNAPSHOT_ROOT, _study_slug
+    study = request.path_params['study']
+    metric = request.query_params.get('metric', 'query_count')
+    partition = os.path.join(SNAPSHOT_ROOT, f"study={_study_slug(study)}")
+    parts = [os.path.join(d, f) for d, _, files in os.walk(partition) for f in files] if os.path.exists(partition) else []
+
+    def build():
+        history = load_history(study, columns=[metric])
+        if history.empty:
+            return None
+        return history[['date', 'Site ID', metric]]
+    return await _respond(request, _file_version(*sorted(parts)), build)
+
+async def rollup(request):
+    level = request.path_params['level']
+    if level not in LEVELS:
+        return JSONResponse({'error': f"unknown level '{level}'", 'levels': list(LEVELS)}, status_code=404)
+    q = request.query_params
+
+    def build():
+        return rollup_lookup(level, study=q.get('study'), region=q.get('region'), country=q.get('country'))
+    return await _respond(request, _file_version(CUBE_FILE), build)
+
+async def safety_search(request):
+    from safety_signals import safety_files, search_signals
+    from term_index import load_index, TERMS_CACHE
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return JSONResponse({'error': "query parameter 'q' is required"}, status_code=400)
+    # Stored catalog and term index only: no folder scan, rows come from the cached row text
+    files = await run_in_threadpool(safety_files, refresh=False)
+
+    def build():
+        return search_signals(query, files, index=load_index(refresh=False), refresh=False)
+    return await _respond(request, _file_version(TERMS_CACHE, *files), build)
+
+async def terms_similar(request):
+    from term_index import similar_terms, load_index, TERMS_CACHE, TOP_K
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return JSONResponse({'error': "query parameter 'q' is required"}, status_code=400)
+    try:
+        k = int(request.query_params.get('k', TOP_K))
+    except ValueError:
+        return JSONResponse({'error': 'k must be an integer'}, status_code=400)
+
+    def build():
+        return pd.DataFrame(similar_terms(query, k=max(1, min(k, MAX_PAGE_SIZE)), index=load_index(refresh=False)),
+                            columns=['term', 'similarity'])
+    return await _respond(request, _file_version(TERMS_CACHE), build)
+
+routes = [
+    Route('/health', health),
+    Route('/studies', studies),
+    Route('/studies/{study}/sites', study_sites),
+    Route('/studies/{study}/visits', study_visits),
+    Route('/studies/{study}/trend', study_trend),
+    Route('/rollup/{level}', rollup),
+    Route('/safety/search', safety_search),
+    Route('/terms/similar', terms_similar),
+]
+
+app = Starlette(routes=routes)
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Read-only query service over the NEST caches.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,198 @@
+import pandas as pd
+import numpy as np
+import os
+import csv
+from file_locks import file_lock, atomic_path
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CUBE_FILE = os.path.join(BASE_DIR, ".cache", "risk_rollup.csv")
+
+# ISO 3166-1 alpha-3 reference (all 249 countries, vendored from pycountry's ISO data):
+# display name, ISO short name and official name per code. Exports mix ISO3 codes ("AUS")
+# with names ("Australia"), so everything is keyed on ISO3.
+COUNTRY_FILE = os.path.join(BASE_DIR, "iso3166_countries.csv")
+
+with open(COUNTRY_FILE, newline='', encoding='utf-8') as f:
+    _COUNTRIES = list(csv.DictReader(f))
+COUNTRY_REFERENCE = {row['alpha_3']: row['name'] for row in _COUNTRIES}
+
+COUNTRY_ALIASES = {
+    'united states of america': 'USA', 'us': 'USA', 'u.s.': 'USA', 'u.s.a.': 'USA',
+    'uk': 'GBR', 'great britain': 'GBR', 'england': 'GBR',
+    'korea': 'KOR', 'republic of korea': 'KOR', 'korea, republic of': 'KOR',
+    'czech republic': 'CZE', 'russian federation': 'RUS', 'turkiye': 'TUR',
+    'ivory coast': 'CIV', 'viet nam': 'VNM', 'dr congo': 'COD', 'holland': 'NLD',
+}
+
+UNKNOWN_COUNTRY = 'UNK'
+
+_NAME_TO_ISO3 = {row[col].lower(): row['alpha_3'] for row in _COUNTRIES
+                 for col in ('official_name', 'iso_name', 'name') if row[col]}
+_NAME_TO_ISO3.update(COUNTRY_ALIASES)
+
+# Additive statistics kept per cell; every coarser level is a sum (or min/max) of finer ones.
+SUM_COLUMNS = ['site_count', 'anomaly_count', 'score_sum', 'score_sq_sum',
+               'query_count', 'missing_page_count', 'sae_count']
+
+LEVELS = {
+    'portfolio': [],
+    'region': ['Region'],
+    # Country levels are keyed on ISO3 alone: studies without an EDC Region fall back to
+    # GLOBAL, so grouping by region too would split one country over several map cells
+    'country': ['Country'],
+    'study': ['Study'],
+    'study_region': ['Study', 'Region'],
+    'study_country': ['Study', 'Country'],
+    'site': ['Study', 'Region', 'Country', 'Site ID'],
+}
+
+NUMERIC_COLUMNS = SUM_COLUMNS + ['score_min', 'score_max']
+CUBE_COLUMNS = ['Level', 'Study', 'Region', 'Country', 'Site ID'] + NUMERIC_COLUMNS
+
+def normalize_country(value):
+    """Maps an ISO3 code, ISO3-like code or country name onto its ISO3 key."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return UNKNOWN_COUNTRY
+    text = str(value).strip()
+    if text.upper() in COUNTRY_REFERENCE:
+        return text.upper()
+    return _NAME_TO_ISO3.get(text.lower(), UNKNOWN_COUNTRY)
+
+def normalize_region(value):
+    text = str(value).strip().upper() if value is not None else ''
+    if text in ('', '0', 'NAN', 'NONE', 'GLOBAL'):
+        return 'GLOBAL'
+    return text
+
+def country_name(iso3):
+    return COUNTRY_REFERENCE.get(iso3, 'Unknown')
+
+def _site_cells(study, scored_df):
+    """Builds the finest (study x region x country x site) grain from a scored site table."""
+    cells = pd.DataFrame({
+        'Study': study,
+        'Region': scored_df['Region'].map(normalize_region) if 'Region' in scored_df else 'GLOBAL',
+        'Country': scored_df['Country'].map(normalize_country) if 'Country' in scored_df else UNKNOWN_COUNTRY,
+        'Site ID': scored_df['Site ID'].astype(str),
+    })
+    score = scored_df['anomaly_score'].astype(float)
+    cells['site_count'] = 1
+    cells['anomaly_count'] = (scored_df['is_anomaly'] == -1).astype(int)
+    cells['score_sum'] = score
+    cells['score_sq_sum'] = score ** 2
+    cells['score_min'] = score
+    cells['score_max'] = score
+    for col in ['query_count', 'missing_page_count', 'sae_count']:
+        cells[col] = scored_df[col].astype(float) if col in scored_df else 0.0
+    # A site can appear under several country/region rows in a raw export; collapse to one cell.
+    return _aggregate(cells, LEVELS['site'])
+
+def _aggregate(cells, keys):
+    agg = {c: 'sum' for c in SUM_COLUMNS}
+    agg.update({'score_min': 'min', 'score_max': 'max'})
+    if keys:
+        out = cells.groupby(keys, as_index=False, observed=True).agg(agg)
+    else:
+        out = cells.agg(agg).to_frame().T
+    return out
+
+STUDY_LEVELS = ['study', 'study_region', 'study_country', 'site']
+PORTFOLIO_LEVELS = ['portfolio', 'region', 'country']
+
+def _materialize(site_cells, levels):
+    frames = []
+    for level in levels:
+        out = _aggregate(site_cells, LEVELS[level])
+        out['Level'] = level
+        frames.append(out)
+    cube = pd.concat(frames, ignore_index=True)
+    for col in ['Study', 'Region', 'Country', 'Site ID']:
+        if col not in cube.columns:
+            cube[col] = '*'
+        cube[col] = cube[col].fillna('*')
+    cube[NUMERIC_COLUMNS] = cube[NUMERIC_COLUMNS].astype(float)
+    return cube[CUBE_COLUMNS]
+
+_cube_memo = {'mtime': None, 'cube': None}
+
+def _write_cube(cube):
+    with atomic_path(CUBE_FILE) as tmp:
+        cube.to_csv(tmp, index=False)
+    _cube_memo.update({'mtime': os.path.getmtime(CUBE_FILE), 'cube': cube})
+
+def load_rollup():
+    """Returns the materialized cube, re-reading the file only when it changed on disk."""
+    if not os.path.exists(CUBE_FILE):
+        return pd.DataFrame(columns=CUBE_COLUMNS)
+    mtime = os.path.getmtime(CUBE_FILE)
+    if _cube_memo['mtime'] != mtime:
+        cube = pd.read_csv(CUBE_FILE, keep_default_na=False,
+                           dtype={c: str for c in ['Level', 'Study', 'Region', 'Country', 'Site ID']})
+        _cube_memo.update({'mtime': mtime, 'cube': cube})
+        # Cubes written before country levels dropped the region key are re-summed from the site grain
+        if (cube['Level'].isin(['country', 'study_country']) & (cube['Region'] != '*')).any():
+            sites = cube[cube['Level'] == 'site']
+            with file_lock("risk_rollup"):
+                _write_cube(_materialize(sites, PORTFOLIO_LEVELS + STUDY_LEVELS))
+    return _cube_memo['cube']
+
+def _same_cells(old, new):
+    """True when a study's stored site cells equal freshly built ones."""
+    if len(old) != len(new):
+        return False
+    old = old[new.columns].astype(new.dtypes.to_dict()).sort_values(list(new.columns)).reset_index(drop=True)
+    return old.equals(new.sort_values(list(new.columns)).reset_index(drop=True))
+
+def update_study_rollup(study, scored_df):
+    """
+    Incrementally refreshes the cube for one study.
+    Only that study's site cells are rebuilt from its scores; every coarser level is
+    re-summed from the stored site grain, so no other study's Excel files are touched.
+    """
+    if scored_df is None or scored_df.empty or 'anomaly_score' not in scored_df.columns:
+        return load_rollup()
+
+    # Read-modify-write of a portfolio file: other studies may be ingested by other processes
+    with file_lock("risk_rollup"):
+        cube = load_rollup()
+        cells = _site_cells(study, scored_df)
+        # Unchanged scores leave the cube (and every cache keyed on its version) untouched
+        if _same_cells(cube[(cube['Level'] == 'site') & (cube['Study'] == study)], cells):
+            return cube
+        kept_sites = cube[(cube['Level'] == 'site') & (cube['Study'] != study)]
+        # Empty frames are left out of the concat (pandas deprecates their dtype inference)
+        frames = [f for f in (kept_sites, cells) if not f.empty]
+        site_cells = pd.concat(frames, ignore_index=True)
+
+        new_cube = _materialize(site_cells, PORTFOLIO_LEVELS + STUDY_LEVELS)
+        _write_cube(new_cube)
+    return new_cube
+
+def rollup_lookup(level, study=None, region=None, country=None):
+    """
+    Cheap lookup of one cube level with derived score statistics.
+    Study-scoped levels ('study', 'study_region', 'study_country', 'site') accept a study filter.
+    """
+    cube = load_rollup()
+    if level not in LEVELS:
+        raise ValueError(f"Unknown rollup level: {level}")
+    out = cube[cube['Level'] == level]
+    if study is not None and 'Study' in LEVELS[level]:
+        out = out[out['Study'] == study]
+    if region is not None:
+        out = out[out['Region'] == normalize_region(region)]
+    if country is not None:
+        out = out[out['Country'] == normalize_country(country)]
+
+    out = out.copy()
+    n = out['site_count'].replace(0, np.nan)
+    out['mean_score'] = out['score_sum'] / n
+    out['std_score'] = np.sqrt((out['score_sq_sum'] / n - out['mean_score'] ** 2).clip(lower=0))
+    out['anomaly_rate'] = out['anomaly_count'] / n
+    out['Country Name'] = out['Country'].map(country_name)
+    return out.reset_index(drop=True)
+
+if __name__ == "__main__":
+    import sys
+    level = sys.argv[1] if len(sys.argv) > 1 else 'country'
+    print(rollup_lookup(level).sort_values('mean_score').head(20).to_string())
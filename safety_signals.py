@@ -0,0 +1,118 @@
+import pandas as pd
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataset_catalog import files_by_category, workbook_layout, layout_keys, stored_layout_key, store_layout_key, STUDY_ROOT
+from term_index import expand_query
+from file_locks import atomic_path
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROWS_DIR = os.path.join(BASE_DIR, ".cache", "safety_rows")
+
+SAFETY_CATEGORIES = ["Coding (MedDRA)", "Coding (WHODD)", "SAE Dashboard"]
+
+# Query the Safety Search page opens with (pre-computed by the warm-up)
+DEFAULT_QUERY = "Headache"
+
+# Result frames kept per (expanded query, file-set version), least recently used evicted first
+MAX_CACHED_SEARCHES = 64
+
+_lock = threading.Lock()
+_memo = OrderedDict()
+_rows_memo = {}
+
+def safety_files(root=STUDY_ROOT, refresh=True):
+    """Safety-relevant workbooks, looked up in the header-signature catalog."""
+    files_found = []
+    for category in SAFETY_CATEGORIES:
+        files_found.extend(files_by_category(category, root=root, refresh=refresh))
+    return files_found
+
+def expand_terms(query, index=None):
+    """
+    The query followed by its related coded and verbatim terms from the term index
+    (term_index.py), including those reached through trigram-similar spellings.
+    """
+    return [query.lower()] + expand_query(query, index=index, fuzzy=True)
+
+def _rows_path(path):
+    name = f"{os.path.basename(os.path.dirname(path))}__{os.path.basename(path)}"
+    return os.path.join(ROWS_DIR, re.sub(r'[^\w.-]', '_', name) + ".parquet")
+
+def _row_text(path, layout, persist=True):
+    """
+    Searchable text of one workbook (every sheet of its detected layout), one lower-cased
+    line per row (cells joined by a separator no term contains), and the rows themselves
+    when they are not in the Parquet cache. The rows are cached as strings in Parquet, so the
+    workbook is only read again after it or its sheet layout (`layout`, from
+    dataset_catalog.layout_keys) changed; the text is memoized in memory. With
+    persist=False nothing is written (no rows file, no learned layout).
+    """
+    version = (os.path.getmtime(path), layout)
+    cached = _rows_memo.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+
+    rows_file = _rows_path(path)
+    if os.path.exists(rows_file) and os.path.getmtime(rows_file) >= version[0] and stored_layout_key(rows_file) == layout:
+        rows = pd.read_parquet(rows_file)
+    else:
+        frames = []
+        for sheet, header_row in workbook_layout(path, learn=persist):
+            df = pd.read_excel(path, sheet_name=sheet, header=int(header_row), engine='calamine')
+            df = df.astype(object).where(df.notna(), None).map(lambda v: None if v is None else str(v))
+            df.columns = [str(c) for c in df.columns]
+            frames.append(df.loc[:, ~pd.Index(df.columns).duplicated()])
+        rows = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        if persist:
+            with atomic_path(rows_file) as tmp:
+                rows.to_parquet(tmp, index=False)
+            store_layout_key(rows_file, layout)
+
+    cells = [rows[c].fillna('') for c in rows.columns]
+    text = cells[0].str.cat(cells[1:], sep='\x1f').str.lower() if cells else pd.Series(dtype=str)
+    # Rows that only live in memory are kept with the text; cached ones are re-read on a match
+    kept = None if persist else rows
+    _rows_memo[path] = (version, text, kept)
+    return text, kept
+
+def search_signals(query, files=None, index=None, refresh=True):
+    """
+    Rows of the safety workbooks mentioning the query or its expansions, tagged with
+    Study, File and Signal Type. Rows are matched against the cached row text, and
+    results are memoized (LRU) on the expansion and the files' modification times and
+    sheet layouts. With refresh=False (the query service) no cache file is written.
+    """
+    files = safety_files(refresh=refresh) if files is None else files
+    expanded = expand_terms(query, index)
+    files = [f for f in files if os.path.exists(f)]
+    layouts = layout_keys(files, learn=refresh)
+    key = (tuple(expanded), tuple((f, os.path.getmtime(f), layouts[f]) for f in files))
+    with _lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            return _memo[key]
+
+    pattern = re.compile('|'.join(re.escape(t.lower()) for t in expanded))
+    results = []
+    for f, _, layout in key[1]:
+        try:
+            text, rows = _row_text(f, layout, persist=refresh)
+            mask = text.str.contains(pattern)
+            if mask.any():
+                rows = pd.read_parquet(_rows_path(f)) if rows is None else rows
+                matches = rows[mask.to_numpy()].copy()
+                matches['Study'] = os.path.basename(os.path.dirname(f))
+                matches['File'] = os.path.basename(f)
+                # Tag if it's an SAE
+                matches['Signal Type'] = "Critical (SAE)" if "sae" in f.lower() else "Operational (Coding)"
+                results.append(matches)
+        except: continue
+
+    master_signals = pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+    with _lock:
+        _memo[key] = master_signals
+        while len(_memo) > MAX_CACHED_SEARCHES:
+            _memo.popitem(last=False)
+    return master_signals
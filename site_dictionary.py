@@ -0,0 +1,95 @@
+import pandas as pd
+import numpy as np
+import os
+import re
+import threading
+from risk_rollup import COUNTRY_REFERENCE
+from file_locks import file_lock, atomic_path
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DICTIONARY_FILE = os.path.join(BASE_DIR, ".cache", "site_dictionary.csv")
+
+# "Site 14", "SITE-014", "site14", "14", "14.0" all describe the same site number
+SITE_PATTERN = r'^\s*(?:site|ste|centre|center)?[\s#_\-\.:]*0*(\d+)(?:\.0+)?\s*([A-Za-z]?)\s*$'
+PREFIXED_PATTERN = r'^\s*(?:site|ste|centre|center)'
+NULL_TOKENS = {'', '-', '--', 'nan', 'none', 'null', 'n/a', 'na', 'total'}
+
+_lock = threading.Lock()
+_memo = {'mtime': None, 'table': None}
+
+def canonical_site_ids(values):
+    """
+    Problem 1 (Semantic Harmonization): normalizes site identifiers across report formats.
+    Returns a Series of canonical 'Site N' ids; rows that are not sites become NaN:
+    country codes leaking in from SiteGroupName columns, dashes, and footer totals
+    (a bare number in a column otherwise written as 'Site N').
+    """
+    values = pd.Series(values)
+    uniques = pd.Series(values.dropna().astype(str).unique())
+    if uniques.empty:
+        return pd.Series(np.nan, index=values.index, dtype=object)
+
+    parts = uniques.str.extract(SITE_PATTERN, flags=re.IGNORECASE)
+    numbered = parts[0].notna()
+    prefixed = uniques.str.match(PREFIXED_PATTERN, case=False)
+    # Mostly 'Site N' -> bare numbers are summary rows; mostly numbers -> they are the sites
+    bare_numbers_are_sites = prefixed[numbered].mean() < 0.5 if numbered.any() else False
+
+    canonical = pd.Series(np.nan, index=uniques.index, dtype=object)
+    keep_numbered = numbered & (prefixed | bare_numbers_are_sites)
+    canonical[keep_numbered] = 'Site ' + parts.loc[keep_numbered, 0] + parts.loc[keep_numbered, 1].str.upper()
+
+    stripped = uniques.str.strip()
+    other = ~numbered & ~stripped.str.lower().isin(NULL_TOKENS) & ~stripped.str.upper().isin(COUNTRY_REFERENCE.keys())
+    canonical[other] = stripped[other]
+
+    lookup = dict(zip(uniques, canonical))
+    return values.astype(str).map(lookup).where(values.notna())
+
+def load_dictionary():
+    """Reads the persisted (Study, Site ID) -> site_key dimension."""
+    if not os.path.exists(DICTIONARY_FILE):
+        return pd.DataFrame({'site_key': pd.Series(dtype='int32'), 'Study': pd.Series(dtype=object), 'Site ID': pd.Series(dtype=object)})
+    mtime = os.path.getmtime(DICTIONARY_FILE)
+    if _memo['mtime'] != mtime:
+        _memo['table'] = pd.read_csv(DICTIONARY_FILE, dtype={'site_key': 'int32', 'Study': str, 'Site ID': str}, keep_default_na=False)
+        _memo['mtime'] = mtime
+    return _memo['table']
+
+def site_keys(study, site_ids):
+    """
+    Returns stable int32 surrogate keys for canonical site ids of one study,
+    registering unseen sites in the dictionary. Keys never change once assigned.
+    """
+    site_ids = pd.Series(site_ids)
+    # Keys are global: concurrent ingests in other processes must not hand out the same key
+    with _lock, file_lock("site_dictionary"):
+        table = load_dictionary()
+        known = table[table['Study'] == study]
+        mapping = dict(zip(known['Site ID'], known['site_key']))
+
+        new_ids = [s for s in site_ids.dropna().unique() if s not in mapping]
+        if new_ids:
+            start = int(table['site_key'].max()) + 1 if not table.empty else 1
+            added = pd.DataFrame({
+                'site_key': np.arange(start, start + len(new_ids), dtype='int32'),
+                'Study': study,
+                'Site ID': new_ids,
+            })
+            mapping.update(zip(added['Site ID'], added['site_key']))
+            table = pd.concat([table, added], ignore_index=True)
+            with atomic_path(DICTIONARY_FILE) as tmp:
+                table.to_csv(tmp, index=False)
+            _memo.update({'mtime': os.path.getmtime(DICTIONARY_FILE), 'table': table})
+
+    return site_ids.map(mapping).astype('Int32')
+
+def apply_site_dtypes(df):
+    """Compact dtypes for the site table: categorical labels, int32 keys and counts."""
+    for col in ['Site ID', 'Country', 'Region']:
+        if col in df.columns:
+            df[col] = df[col].astype(str).astype('category')
+    for col in ['site_key', 'query_count', 'missing_page_count', 'sae_count', 'overdue_visit_count', 'max_days_overdue']:
+        if col in df.columns:
+            df[col] = df[col].fillna(0).astype('int32')
+    return df
@@ -0,0 +1,136 @@
+import pandas as pd
+import numpy as np
+import os
+import re
+import glob
+from urllib.parse import quote
+from datetime import date, datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
+from file_locks import atomic_path
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_ROOT = os.path.join(BASE_DIR, ".cache", "snapshots")
+
+MONTHS = {m: i for i, m in enumerate(['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], 1)}
+_MON = r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)'
+
+# Extraction dates as they appear in CPID export names:
+# "14NOV2025", "14 NOV 2025", "14-Nov-2025", "13 Nov 25", "2025_Nov_12", "20251107"
+DATE_PATTERNS = [
+    (re.compile(r'(?<!\d)(\d{1,2})[\s_\-]?' + _MON + r'[\s_\-]?(\d{4}|\d{2})(?!\d)', re.I), ('d', 'm', 'y')),
+    (re.compile(r'(?<!\d)(20\d{2})[\s_\-]' + _MON + r'[\s_\-](\d{1,2})(?!\d)', re.I), ('y', 'm', 'd')),
+    (re.compile(r'(?<!\d)(20\d{2})(\d{2})(\d{2})(?!\d)'), ('y', 'mm', 'd')),
+]
+
+SNAPSHOT_COLUMNS = ['Site ID', 'site_key', 'Country', 'Region', 'query_count',
+                    'missing_page_count', 'sae_count', 'overdue_visit_count', 'max_days_overdue',
+                    'anomaly_score', 'is_anomaly']
+
+def parse_extraction_date(file_name):
+    """Returns the extraction date embedded in an export file name, or None."""
+    for pattern, order in DATE_PATTERNS:
+        for match in pattern.finditer(file_name):
+            parts = dict(zip(order, match.groups()))
+            try:
+                year = int(parts['y'])
+                year = year + 2000 if year < 100 else year
+                month = MONTHS[parts['m'].lower()] if 'm' in parts else int(parts['mm'])
+                return date(year, month, int(parts['d']))
+            except (ValueError, KeyError):
+                continue
+    return None
+
+def extraction_date(source_files):
+    """Latest extraction date across a study's source workbooks (file mtime when names carry none)."""
+    source_files = [f for f in source_files if f]
+    dates = [parse_extraction_date(os.path.basename(f)) for f in source_files]
+    dates = [d for d in dates if d is not None]
+    if dates:
+        return max(dates)
+    mtimes = [os.path.getmtime(f) for f in source_files if os.path.exists(f)]
+    return datetime.fromtimestamp(max(mtimes)).date() if mtimes else date.today()
+
+def _study_slug(study):
+    # Partition values are URI-encoded, so pyarrow hands back the original study folder name
+    return quote(study, safe='')
+
+def _partition_dir(study, snapshot_date):
+    return os.path.join(SNAPSHOT_ROOT, f"study={_study_slug(study)}", f"date={snapshot_date.isoformat()}")
+
+def record_snapshot(study, scored_df, source_files):
+    """
+    Appends the scored site metrics of one study extraction to the store.
+    Partitions are study=<study>/date=<extraction date>; existing part files are never
+    rewritten. Re-ingesting an unchanged extraction is a no-op, a changed one adds a new part.
+    """
+    if scored_df is None or scored_df.empty:
+        return None
+    snapshot_date = extraction_date(source_files)
+    part_dir = _partition_dir(study, snapshot_date)
+    os.makedirs(part_dir, exist_ok=True)
+
+    frame = scored_df[[c for c in SNAPSHOT_COLUMNS if c in scored_df.columns]].copy()
+    for col in ['Site ID', 'Country', 'Region']:
+        if col in frame.columns:
+            frame[col] = frame[col].astype(str).astype('category')
+    for col in ['site_key', 'query_count', 'missing_page_count', 'sae_count', 'overdue_visit_count', 'max_days_overdue', 'is_anomaly']:
+        if col in frame.columns:
+            frame[col] = frame[col].fillna(0).astype('int32')
+    if 'anomaly_score' in frame.columns:
+        frame['anomaly_score'] = frame['anomaly_score'].astype('float32')
+
+    existing = sorted(glob.glob(os.path.join(part_dir, "part-*.parquet")))
+    if existing:
+        latest = pq.read_table(existing[-1]).to_pandas()
+        if latest.reset_index(drop=True).astype(str).equals(frame.reset_index(drop=True).astype(str)):
+            return existing[-1]
+
+    path = os.path.join(part_dir, f"part-{len(existing):04d}.parquet")
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    with atomic_path(path) as tmp:
+        pq.write_table(table, tmp, compression='zstd', use_dictionary=True)
+    return path
+
+def load_history(study=None, columns=None):
+    """
+    Reads snapshots (optionally for one study) straight from the partitioned store.
+    Only the latest part of each (study, date) partition is kept.
+    """
+    study_glob = f"study={_study_slug(study)}" if study is not None else "study=*"
+    partitions = sorted(glob.glob(os.path.join(SNAPSHOT_ROOT, study_glob, "date=*")))
+    latest_parts = [max(parts) for parts in (glob.glob(os.path.join(p, "part-*.parquet")) for p in partitions) if parts]
+    if not latest_parts:
+        return pd.DataFrame(columns=['study', 'date'] + SNAPSHOT_COLUMNS)
+
+    partitioning = ds.partitioning(pa.schema([('study', pa.string()), ('date', pa.string())]), flavor="hive")
+    dataset = ds.dataset(latest_parts, format="parquet", partitioning=partitioning, partition_base_dir=SNAPSHOT_ROOT)
+    read_columns = None if columns is None else ['study', 'date'] + list(dict.fromkeys(['Site ID'] + columns))
+    history = dataset.to_table(columns=read_columns).to_pandas()
+    history['date'] = pd.to_datetime(history['date'])
+    return history.sort_values(['study', 'date']).reset_index(drop=True)
+
+def site_trend(study, metric='query_count'):
+    """Date x Site matrix of one metric across every stored extraction of a study."""
+    history = load_history(study, columns=[metric])
+    if history.empty:
+        return pd.DataFrame()
+    return history.pivot_table(index='date', columns='Site ID', values=metric, aggfunc='sum', observed=True)
+
+def accrual_rate(study, metric='sae_count'):
+    """
+    Per-site growth of a metric per day between consecutive extractions
+    (e.g. query backlog growth or SAE accrual rate).
+    """
+    trend = site_trend(study, metric)
+    if len(trend) < 2:
+        return pd.DataFrame()
+    days = trend.index.to_series().diff().dt.days.replace(0, np.nan)
+    rate = trend.diff().div(days, axis=0).iloc[1:]
+    return rate.stack().rename(f'{metric}_per_day').reset_index()
+
+if __name__ == "__main__":
+    history = load_history()
+    print(f"Snapshots: {history.groupby(['study', 'date']).ngroups} | Rows: {len(history)}")
+    print(history.groupby(['study', 'date'])[['query_count', 'sae_count']].sum().to_string())
@@ -0,0 +1,213 @@
+import pandas as pd
+import numpy as np
+import os
+import threading
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dataset_catalog import refresh_catalog, workbook_layout, layout_keys, STUDY_ROOT
+from site_dictionary import canonical_site_ids
+from file_locks import atomic_path
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_ROOT = os.path.join(BASE_DIR, ".cache", "subject_index")
+
+# Report types copied into the index (every relevant sheet of the detected workbook layout)
+REPORT_CATEGORIES = ['EDC Metrics', 'Data Review (EDRR)', 'Missing Pages', 'SAE Dashboard', 'Coding (MedDRA)',
+                     'Coding (WHODD)', 'Lab/Range Report', 'Visit Tracker', 'Inactivated Records']
+
+# Header spellings, matched case-insensitively and exactly (reports without a site
+# column, e.g. EDRR and coding, take the site from the other reports of the study)
+SITE_HEADERS = ['site id', 'sitenumber', 'site number', 'study site number', 'site']
+SUBJECT_HEADERS = ['subject id', 'subject', 'subjectname', 'subject name', 'patient id']
+
+# Small row groups keep a drill-down read to a few kilobytes
+ROW_GROUP_SIZE = 1024
+
+INDEX_COLUMNS = ['Category', 'File', 'Modified', 'Layout', 'Site ID', 'Subject', 'start', 'stop']
+
+_lock = threading.Lock()
+_memo = {}
+
+def _study_dir(study):
+    return os.path.join(INDEX_ROOT, study.replace(' ', '_'))
+
+def _copy_path(study, category):
+    slug = category.lower().replace('/', '_').replace(' ', '_').replace('(', '').replace(')', '')
+    return os.path.join(_study_dir(study), f"{slug}.parquet")
+
+def _pick(columns, spellings):
+    names = {str(c).strip().lower(): c for c in columns}
+    return next((names[s] for s in spellings if s in names), None)
+
+def read_report(path, header_row=0, sheet=0):
+    """One sheet of a report as strings, with canonical 'Site ID' / 'Subject' columns (site may be missing)."""
+    df = pd.read_excel(path, sheet_name=sheet, header=int(header_row), engine='calamine', dtype=object)
+    df.columns = [str(c).strip() or f"Column {i}" for i, c in enumerate(df.columns)]
+    df = df.loc[:, ~pd.Index(df.columns).duplicated()]
+    subject_col = _pick(df.columns, SUBJECT_HEADERS)
+    if subject_col is None:
+        return pd.DataFrame()
+    site_col = _pick(df.columns, SITE_HEADERS)
+    records = df.astype(str).where(df.notna(), None).drop(columns=['Site ID', 'Subject'], errors='ignore')
+    records.insert(0, 'Subject', df[subject_col].astype(str).str.strip().where(df[subject_col].notna()))
+    # A site column whose value is not a site ('-', totals) gives 'Unassigned', as the pipeline drops those
+    # rows from its counts; only reports without a site column take the site from the subject
+    records.insert(0, 'Site ID', canonical_site_ids(df[site_col]).fillna('Unassigned') if site_col else None)
+    return records.dropna(subset=['Subject'])
+
+def read_report_sheets(path):
+    """Every relevant sheet of a report (e.g. the SAE DM and Safety queues), as read by the pipeline."""
+    frames = [read_report(path, header_row, sheet) for sheet, header_row in workbook_layout(path)]
+    frames = [f for f in frames if not f.empty]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def _layouts(study, catalog, root):
+    """{file: layout key} for a study's catalogued reports."""
+    paths = {f: os.path.join(root, study, f) for f in catalog['File']}
+    keys = layout_keys(list(paths.values()))
+    return {f: keys[p] for f, p in paths.items()}
+
+def build_study_index(study, root=STUDY_ROOT, full=False):
+    """
+    Writes a sorted columnar copy of each report of a study and returns the index of
+    (Site ID, Subject) -> [start, stop) row ranges into those copies. Reports whose
+    workbook hasn't changed since the last build keep their copy and index rows.
+    """
+    catalog = refresh_catalog([study], root=root)
+    catalog = catalog[(catalog['Study'] == study) & catalog['Category'].isin(REPORT_CATEGORIES)]
+    catalog = catalog.sort_values('Modified').drop_duplicates('Category', keep='last')
+
+    previous = load_index(study) if not full else pd.DataFrame(columns=INDEX_COLUMNS)
+    layouts = _layouts(study, catalog, root)
+    current = {(r['Category'], r['File'], float(r['Modified']), layouts[r['File']]) for _, r in catalog.iterrows()}
+    unchanged = [(c, f, float(m), l) in current for c, f, m, l in
+                 zip(previous['Category'], previous['File'], previous['Modified'], previous['Layout'])]
+    kept = previous[pd.Series(unchanged, index=previous.index, dtype=bool)]
+
+    stale = catalog[~catalog['Category'].isin(kept['Category'])]
+    reports = {}
+    for _, r in stale.iterrows():
+        try:
+            reports[r['Category']] = (r, read_report_sheets(os.path.join(root, study, r['File'])))
+        except Exception as e:
+            reports[r['Category']] = (r, pd.DataFrame())
+            with open(os.path.join(BASE_DIR, "activity_log.txt"), "a") as f:
+                f.write(f"Subject index: could not read {r['File']} in {study}: {e}\n")
+
+    # Subject -> site from every report that carries both, for reports that only list subjects
+    subject_sites = pd.concat([df[['Subject', 'Site ID']].dropna() for _, df in reports.values() if not df.empty] +
+                              [kept[['Subject', 'Site ID']]], ignore_index=True)
+    subject_sites = subject_sites[subject_sites['Site ID'] != 'Unassigned'].drop_duplicates('Subject').set_index('Subject')['Site ID']
+
+    os.makedirs(_study_dir(study), exist_ok=True)
+    entries = [kept]
+    for category, (r, df) in reports.items():
+        if df.empty:
+            # Empty marker range: the workbook is indexed but has no subject rows
+            entries.append(pd.DataFrame([[category, r['File'], float(r['Modified']), layouts[r['File']], None, None, 0, 0]], columns=INDEX_COLUMNS))
+            continue
+        df['Site ID'] = df['Site ID'].fillna(df['Subject'].map(subject_sites)).fillna('Unassigned')
+        df = df.sort_values(['Site ID', 'Subject'], kind='stable').reset_index(drop=True)
+        with atomic_path(_copy_path(study, category)) as tmp:
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp,
+                           row_group_size=ROW_GROUP_SIZE, compression='zstd')
+
+        positions = df.groupby(['Site ID', 'Subject'], sort=False).indices
+        ranges = pd.DataFrame([(s, subj, idx[0], idx[-1] + 1) for (s, subj), idx in positions.items()],
+                              columns=['Site ID', 'Subject', 'start', 'stop'])
+        ranges.insert(0, 'Category', category)
+        ranges.insert(1, 'File', r['File'])
+        ranges.insert(2, 'Modified', float(r['Modified']))
+        ranges.insert(3, 'Layout', layouts[r['File']])
+        entries.append(ranges)
+
+    index = pd.concat([e for e in entries if not e.empty], ignore_index=True) if any(not e.empty for e in entries) else pd.DataFrame(columns=INDEX_COLUMNS)
+    index = index[INDEX_COLUMNS].astype({'start': 'int64', 'stop': 'int64'})
+    with atomic_path(os.path.join(_study_dir(study), "index.parquet")) as tmp:
+        index.to_parquet(tmp, index=False)
+    if reports:
+        with open(os.path.join(BASE_DIR, "activity_log.txt"), "a") as f:
+            f.write(f"Subject index for {study}: {len(reports)} report(s) re-indexed, {index[['Site ID', 'Subject']].drop_duplicates().shape[0]} subjects.\n")
+    return index
+
+def load_index(study):
+    """Persisted (study, site, subject) -> row range index, memoized on file mtime."""
+    path = os.path.join(_study_dir(study), "index.parquet")
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=INDEX_COLUMNS)
+    mtime = os.path.getmtime(path)
+    if study not in _memo or _memo[study][0] != mtime:
+        index = pd.read_parquet(path)
+        # Indexes written before layout keys were stored are rebuilt on the next refresh
+        if 'Layout' not in index.columns:
+            index.insert(3, 'Layout', None)
+        _memo[study] = (mtime, index)
+    return _memo[study][1]
+
+def refresh_index(study, root=STUDY_ROOT):
+    """Index of one study, rebuilt for the reports whose workbook changed."""
+    with _lock:
+        catalog = refresh_catalog([study], root=root)
+        catalog = catalog[(catalog['Study'] == study) & catalog['Category'].isin(REPORT_CATEGORIES)]
+        latest = catalog.sort_values('Modified').drop_duplicates('Category', keep='last')
+        index = load_index(study)
+        # A report is current when its workbook and the sheet layout read from it are unchanged
+        layouts = _layouts(study, latest, root)
+        indexed = set(zip(index['Category'], index['File'], index['Modified'].astype(float), index['Layout']))
+        if all((c, f, float(m), layouts[f]) in indexed for c, f, m in zip(latest['Category'], latest['File'], latest['Modified'])) \
+                and set(index['Category']) <= set(latest['Category']):
+            return index
+        return build_study_index(study, root)
+
+def site_subjects(study, site_id):
+    """Subjects of one site with their record count per report type (answered from the index alone)."""
+    index = refresh_index(study)
+    rows = index[index['Site ID'] == site_id]
+    if rows.empty:
+        return pd.DataFrame(columns=['Subject'])
+    counts = rows.assign(records=rows['stop'] - rows['start']).pivot_table(
+        index='Subject', columns='Category', values='records', aggfunc='sum', fill_value=0)
+    return counts.reset_index()
+
+def _read_ranges(path, ranges):
+    """Reads only the row groups covering the given [start, stop) ranges of a columnar copy."""
+    pf = pq.ParquetFile(path)
+    sizes = [pf.metadata.row_group(i).num_rows for i in range(pf.metadata.num_row_groups)]
+    offsets = np.cumsum([0] + sizes)
+    pieces = []
+    for i in range(len(sizes)):
+        lo, hi = offsets[i], offsets[i + 1]
+        hits = [(max(a, lo), min(b, hi)) for a, b in ranges if a < hi and b > lo]
+        if hits:
+            group = pf.read_row_group(i)
+            pieces.extend(group.slice(a - lo, b - a) for a, b in hits)
+    return pa.concat_tables(pieces).to_pandas() if pieces else pd.DataFrame()
+
+def subject_records(study, site_id, subject=None, categories=None):
+    """
+    Drill-down records for one site (or one subject of it): {category: DataFrame}.
+    Only the row groups holding that site's rows are read from each columnar copy.
+    """
+    index = refresh_index(study)
+    rows = index[index['Site ID'] == site_id]
+    if subject is not None:
+        rows = rows[rows['Subject'] == subject]
+    if categories is not None:
+        rows = rows[rows['Category'].isin(categories)]
+
+    records = {}
+    for category, group in rows.groupby('Category'):
+        path = _copy_path(study, category)
+        if os.path.exists(path):
+            records[category] = _read_ranges(path, list(zip(group['start'], group['stop'])))
+    return records
+
+if __name__ == "__main__":
+    import sys
+    import time
+    study = sys.argv[1] if len(sys.argv) > 1 else "Study 1_CPID_Input Files - Anonymization"
+    index = refresh_index(study)
+    site = index['Site ID'].iloc[0]
+    t0 = time.perf_counter()
+    records = subject_records(study, site)
+    print(f"{site}: {sum(len(r) for r in records.values())} records from {len(records)} reports in {(time.perf_counter() - t0) * 1000:.1f} ms")
@@ -0,0 +1,255 @@
+import pandas as pd
+import os
+import re
+import bisect
+import threading
+from dataset_catalog import refresh_catalog, workbook_layout, layout_keys, STUDY_ROOT
+from file_locks import atomic_path
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TERMS_CACHE = os.path.join(BASE_DIR, ".cache", "term_paths.parquet")
+
+CODING_CATEGORIES = ["Coding (MedDRA)", "Coding (WHODD)"]
+
+# Hierarchy levels, most specific first, with the header spellings of the coding exports
+# (MedDRA: verbatim -> LLT -> PT -> HLT -> HLGT -> SOC; WHODrug: verbatim -> drug -> ATC)
+TERM_LEVELS = [
+    ('verbatim', ['verbatim term', 'verbatim', 'reported term', 'aeterm', 'mhterm', 'cmtrt']),
+    ('llt', ['lowest level term', 'llt', 'llt name', 'trade name']),
+    ('pt', ['preferred term', 'pt', 'pt name', 'coded term', 'drug name', 'preferred name']),
+    ('hlt', ['high level term', 'hlt', 'hlt name']),
+    ('hlgt', ['high level group term', 'hlgt', 'hlgt name']),
+    ('soc', ['system organ class', 'soc', 'soc name', 'primary soc', 'atc', 'atc text']),
+]
+LEVEL_RANK = {level: i for i, (level, _) in enumerate(TERM_LEVELS)}
+ANCHOR_LEVEL = 'pt'
+
+# Curated synonym groups (term -> synonyms), loaded into the index alongside the coded
+# hierarchy; the anonymized exports carry only dictionary/form/field OIDs, no term columns
+SEED_SYNONYMS = {
+    "headache": ["migraine", "cephalgia", "head pain"],
+    "nausea": ["vomiting", "emesis", "upset stomach", "queasiness"],
+    "pain": ["ache", "discomfort", "soreness"],
+    "fatigue": ["tiredness", "lethargy", "exhaustion"],
+    "fever": ["pyrexia", "temperature", "hyperthermia"]
+}
+
+# Shorter query words would prefix-match most of the vocabulary
+MIN_PREFIX = 3
+
+# Trigram similarity (shared / union of trigrams, as in pg_trgm) for typo-tolerant lookup;
+# shorter queries share a trigram with too much of the vocabulary
+SIMILARITY_THRESHOLD = 0.3
+MIN_FUZZY_LENGTH = 4
+TOP_K = 10
+
+# Hits at or above this level (HLGT, SOC) are searched as themselves, not with everything under them
+BROAD_LEVEL = 'hlgt'
+
+PATH_COLUMNS = ['File', 'Modified', 'Layout'] + [level for level, _ in TERM_LEVELS]
+
+_lock = threading.Lock()
+_memo = {'mtime': None, 'index': None}
+
+def _normalize(value):
+    return re.sub(r'\s+', ' ', str(value)).strip().lower()
+
+def read_term_paths(path):
+    """
+    Distinct hierarchy paths (one column per level present) of one coding report, lower-cased,
+    from every sheet of its detected layout.
+    """
+    frames = []
+    for sheet, header_row in workbook_layout(path):
+        df = pd.read_excel(path, sheet_name=sheet, header=int(header_row), engine='calamine', dtype=object)
+        names = {str(c).strip().lower(): c for c in df.columns}
+        paths = pd.DataFrame(index=df.index)
+        for level, spellings in TERM_LEVELS:
+            col = next((names[s] for s in spellings if s in names), None)
+            if col is not None:
+                paths[level] = df[col].where(df[col].notna()).map(_normalize, na_action='ignore')
+        frames.append(paths.reindex(columns=[level for level, _ in TERM_LEVELS]))
+    paths = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    return paths.dropna(how='all').drop_duplicates()
+
+def build_term_paths(root=STUDY_ROOT):
+    """
+    Hierarchy paths of every coding report in the portfolio. Only reports that are new or
+    modified since the last build are read; the others keep their cached rows.
+    """
+    catalog = refresh_catalog(root=root)
+    reports = catalog[catalog['Category'].isin(CODING_CATEGORIES)]
+    files = [os.path.join(s, f) for s, f in zip(reports['Study'], reports['File'])]
+    layouts = layout_keys([os.path.join(root, f) for f in files])
+    # A report is re-read when the workbook or the sheet layout read from it changed
+    current = {f: (float(m), layouts[os.path.join(root, f)]) for f, m in zip(files, reports['Modified'])}
+
+    previous = pd.read_parquet(TERMS_CACHE) if os.path.exists(TERMS_CACHE) else pd.DataFrame(columns=PATH_COLUMNS)
+    if 'Layout' not in previous.columns:
+        previous.insert(2, 'Layout', None)
+    unchanged = [current.get(f) == (m, l) for f, m, l in zip(previous['File'], previous['Modified'], previous['Layout'])]
+    kept = previous[pd.Series(unchanged, index=previous.index, dtype=bool)]
+    stale = [(f, m, l) for f, (m, l) in current.items() if f not in set(kept['File'])]
+    if not stale and len(kept) == len(previous):
+        return previous
+
+    frames = [kept]
+    for f, m, l in stale:
+        try:
+            paths = read_term_paths(os.path.join(root, f))
+        except Exception as e:
+            paths = pd.DataFrame(columns=PATH_COLUMNS[3:])
+            with open(os.path.join(BASE_DIR, "activity_log.txt"), "a") as log:
+                log.write(f"Term index: could not read {f}: {e}\n")
+        if paths.empty:
+            # Marker row: the report is indexed but carries no term columns
+            paths = pd.DataFrame([[None] * len(TERM_LEVELS)], columns=PATH_COLUMNS[3:])
+        paths.insert(0, 'File', f)
+        paths.insert(1, 'Modified', m)
+        paths.insert(2, 'Layout', l)
+        frames.append(paths)
+
+    table = pd.concat([f for f in frames if not f.empty], ignore_index=True)[PATH_COLUMNS]
+    table = table.astype({level: object for level, _ in TERM_LEVELS})
+    with atomic_path(TERMS_CACHE) as tmp:
+        table.to_parquet(tmp, index=False)
+    with open(os.path.join(BASE_DIR, "activity_log.txt"), "a") as log:
+        log.write(f"Term index: {len(stale)} coding report(s) re-read, {len(table)} hierarchy paths.\n")
+    return table
+
+def build_index(paths):
+    """
+    In-memory lookup structures: parent/child edges between adjacent levels, the highest
+    level each term was seen at, a sorted word vocabulary (word -> terms) for prefix lookup
+    and an inverted trigram index (trigram -> terms) for approximate matching.
+    """
+    down, up, rank = {}, {}, {}
+    levels = [level for level, _ in TERM_LEVELS]
+    seeds = [{ANCHOR_LEVEL: k, 'verbatim': s} for k, syns in SEED_SYNONYMS.items() for s in syns]
+    rows = paths[levels].to_dict('records') + seeds
+    for row in rows:
+        chain = [(row[l], LEVEL_RANK[l]) for l in levels if isinstance(row.get(l), str) and row.get(l)]
+        for term, r in chain:
+            rank[term] = max(rank.get(term, r), r)
+        for (child, _), (parent, _) in zip(chain, chain[1:]):
+            if child != parent:
+                down.setdefault(parent, set()).add(child)
+                up.setdefault(child, set()).add(parent)
+
+    words = {}
+    for term in rank:
+        for w in set(term.split()):
+            words.setdefault(w, set()).add(term)
+
+    grams, gram_counts = {}, {}
+    for term in rank:
+        term_grams = trigrams(term)
+        gram_counts[term] = len(term_grams)
+        for g in term_grams:
+            grams.setdefault(g, []).append(term)
+    return {'down': down, 'up': up, 'rank': rank, 'words': words, 'vocabulary': sorted(words),
+            'grams': grams, 'gram_counts': gram_counts}
+
+def trigrams(text):
+    """Set of trigrams of a term; each word is padded ('  word ') so word starts weigh more."""
+    grams = set()
+    for word in _normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def load_index(root=STUDY_ROOT, refresh=True):
+    """
+    Term index over the portfolio's coding reports, rebuilt only when a report changed.
+    With refresh=False the cached term paths are used as they are (no catalog scan).
+    """
+    with _lock:
+        if refresh:
+            build_term_paths(root)
+        mtime = os.path.getmtime(TERMS_CACHE) if os.path.exists(TERMS_CACHE) else 0
+        if _memo['mtime'] != mtime or _memo['index'] is None:
+            paths = pd.read_parquet(TERMS_CACHE) if mtime else pd.DataFrame(columns=PATH_COLUMNS)
+            _memo.update({'mtime': mtime, 'index': build_index(paths)})
+        return _memo['index']
+
+def _prefix_terms(index, prefix):
+    vocabulary = index['vocabulary']
+    start = bisect.bisect_left(vocabulary, prefix)
+    stop = bisect.bisect_left(vocabulary, prefix + '\uffff')
+    return set().union(*(index['words'][w] for w in vocabulary[start:stop]))
+
+def match_terms(query, index=None):
+    """
+    Indexed terms a query refers to: terms having a word starting with each query word
+    ("head" -> headache), and terms all of whose words occur in the query ("severe headache").
+    """
+    index = load_index() if index is None else index
+    tokens = _normalize(query).split()
+    if not tokens:
+        return set()
+    prefixed = None
+    if all(len(t) >= MIN_PREFIX for t in tokens):
+        for t in tokens:
+            found = _prefix_terms(index, t)
+            prefixed = found if prefixed is None else prefixed & found
+    contained = {term for t in set(tokens) for term in index['words'].get(t, ())
+                 if set(term.split()) <= set(tokens)}
+    return (prefixed or set()) | contained
+
+def _descendants(index, term):
+    seen, stack = {term}, [term]
+    while stack:
+        for child in index['down'].get(stack.pop(), ()):
+            if child not in seen:
+                seen.add(child)
+                stack.append(child)
+    return seen
+
+def similar_terms(query, k=TOP_K, threshold=SIMILARITY_THRESHOLD, index=None):
+    """
+    Top-k indexed terms by trigram similarity to the query ("headach" -> headache), as
+    [(term, similarity)]. Only terms sharing a trigram with the query are scored.
+    """
+    index = load_index() if index is None else index
+    query_grams = trigrams(query)
+    if not query_grams or len(_normalize(query).replace(' ', '')) < MIN_FUZZY_LENGTH:
+        return []
+    shared = {}
+    for g in query_grams:
+        for term in index['grams'].get(g, ()):
+            shared[term] = shared.get(term, 0) + 1
+    scored = [(term, n / (len(query_grams) + index['gram_counts'][term] - n)) for term, n in shared.items()]
+    scored = [(term, round(sim, 3)) for term, sim in scored if sim >= threshold]
+    return sorted(scored, key=lambda x: (-x[1], len(x[0]), x[0]))[:k]
+
+def expand_query(query, index=None, fuzzy=False):
+    """
+    Query expansion through the hierarchy: each matched term is lifted to its preferred
+    term (terms above PT stay where they are) and expanded to everything coded under it,
+    i.e. the PT, its LLTs and every verbatim term reported for them. Matching is tiered:
+    an exact term, else word/prefix matches, else (with `fuzzy`) trigram-similar terms.
+    HLGT/SOC hits are kept as themselves rather than expanded to all their descendants.
+    """
+    index = load_index() if index is None else index
+    query_term = _normalize(query)
+    matched = {query_term} if query_term in index['rank'] else match_terms(query, index)
+    if fuzzy and not matched:
+        matched = {term for term, _ in similar_terms(query, index=index)}
+    broad = {term for term in matched if index['rank'][term] >= LEVEL_RANK[BROAD_LEVEL]}
+    anchors = set()
+    for term in matched - broad:
+        frontier = {term}
+        for _ in TERM_LEVELS:
+            if not any(index['rank'][t] < LEVEL_RANK[ANCHOR_LEVEL] and index['up'].get(t) for t in frontier):
+                break
+            frontier = {p for t in frontier for p in (index['up'].get(t) or {t})}
+        anchors |= frontier
+    expanded = set().union(broad, *(_descendants(index, a) for a in anchors))
+    return sorted(expanded - {query_term})
+
+if __name__ == "__main__":
+    import sys
+    index = load_index()
+    print(f"{len(index['rank'])} terms, {len(index['vocabulary'])} words")
+    for q in sys.argv[1:] or ["headache"]:
+        print(q, "->", expand_query(q, index, fuzzy=True), similar_terms(q, index=index))
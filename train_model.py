@@ -3,17 +3,52 @@ import numpy as np
 from sklearn.ensemble import IsolationForest
 import joblib
 import os
+from file_locks import atomic_path
 
-def train_custom_model():
+VISIT_FEATURES = ['overdue_visit_count', 'max_days_overdue']
+# Features listed as a site's drivers (largest positive contributions first)
+MAX_DRIVERS = 2
+
+def explain_scores(model, X):
+    """
+    Per-feature contributions to every site's anomaly score, by perturbation: each feature
+    is reset to the study median and the site re-scored. All (feature, site) perturbations
+    go through one batched decision_function call. A positive contribution is how much
+    more normal the site would look with a typical value, i.e. how much that feature
+    pushed it towards an anomaly.
+    """
+    n_sites, n_features = X.shape
+    perturbed = np.repeat(X.to_numpy(dtype=float)[None, :, :], n_features, axis=0)
+    baseline = X.median().to_numpy(dtype=float)
+    for j in range(n_features):
+        perturbed[j, :, j] = baseline[j]
+    batch = pd.DataFrame(perturbed.reshape(n_features * n_sites, n_features), columns=X.columns)
+    rescored = model.decision_function(batch).reshape(n_features, n_sites)
+    contributions = rescored - model.decision_function(X)[None, :]
+    return pd.DataFrame(contributions.T, columns=[f"contrib_{f}" for f in X.columns], index=X.index)
+
+def top_drivers(contributions, max_drivers=MAX_DRIVERS):
+    """'feature;feature' string of each site's largest positive contributions (empty when none)."""
+    names = np.array([c[len('contrib_'):] for c in contributions.columns])
+    values = contributions.to_numpy()
+    order = np.argsort(-values, axis=1)[:, :max_drivers]
+    return pd.Series([';'.join(names[o][values[i, o] > 0]) for i, o in enumerate(order)], index=contributions.index)
+
+def train_custom_model(csv_path=None, output_path=None, model_path=None):
+    # Defaults are the repo-level files; study_ingest.py passes per-study paths under .cache/
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    csv_path = os.path.join(BASE_DIR, "processed_site_metrics.csv")
+    csv_path = csv_path or os.path.join(BASE_DIR, "processed_site_metrics.csv")
+    model_path = model_path or os.path.join(BASE_DIR, "anomaly_model.joblib")
+    output_path = output_path or os.path.join(BASE_DIR, "scored_site_metrics.csv")
     if not os.path.exists(csv_path):
         print(f"Error: {csv_path} not found. Run the data pipeline first.")
         return
 
     df = pd.read_csv(csv_path)
-    # Features for the model: query_count, missing_page_count, sae_count
-    X = df[['query_count', 'missing_page_count', 'sae_count']]
+    # Features for the model: query_count, missing_page_count, sae_count,
+    # plus the visit backlog columns when the pipeline supplied them
+    features = ['query_count', 'missing_page_count', 'sae_count'] + [c for c in VISIT_FEATURES if c in df.columns]
+    X = df[features].fillna(0)
     
     print("Training Isolation Forest for Anomaly Detection...")
     # contamination is the expected proportion of outliers (sites with unusual bottlenecks)
@@ -21,16 +56,21 @@ def train_custom_model():
     model.fit(X)
     
     # Save the model
-    model_path = os.path.join(BASE_DIR, "anomaly_model.joblib")
-    joblib.dump(model, model_path)
+    with atomic_path(model_path) as tmp:
+        joblib.dump(model, tmp)
     print(f"Model saved to {model_path}")
     
     # Predict and add scores to the dataframe for dashboard use
     df['anomaly_score'] = model.decision_function(X)
     df['is_anomaly'] = model.predict(X) # -1 for anomaly, 1 for normal
+
+    # Explanations are stored with the scores, so narratives cite drivers without model work at click time
+    contributions = explain_scores(model, X).round(4)
+    df = df.join(contributions)
+    df['top_drivers'] = top_drivers(contributions)
     
-    output_path = os.path.join(BASE_DIR, "scored_site_metrics.csv")
-    df.to_csv(output_path, index=False)
+    with atomic_path(output_path) as tmp:
+        df.to_csv(tmp, index=False)
     print(f"Scored metrics saved to {output_path}")
 
 if __name__ == "__main__":
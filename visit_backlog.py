@@ -0,0 +1,180 @@
+import pandas as pd
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataset_catalog import refresh_catalog, workbook_layout, layout_key, stored_layout_key, store_layout_key, STUDY_ROOT
+from site_dictionary import canonical_site_ids, site_keys
+from snapshot_store import parse_extraction_date
+from file_locks import atomic_path
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+VISITS_CACHE = os.path.join(BASE_DIR, ".cache", "visit_backlog.parquet")
+VISIT_COLUMNS = ['Study', 'Site ID', 'site_key', 'Subject', 'Visit', 'Projected Date', 'As Of', 'days_overdue', 'Source File']
+
+# Tracker column -> accepted header spellings (exact match first, then prefix)
+TRACKER_COLUMNS = {
+    'Country': ['country'],
+    'Site ID': ['site'],
+    'Subject': ['subject', 'subject name'],
+    'Visit': ['visit'],
+    'Projected Date': ['projected date'],
+    'Days Outstanding': ['# days outstanding'],
+}
+
+# Visits projected within this many days after the extraction count as upcoming load
+UPCOMING_WINDOW_DAYS = 30
+
+_memo = {'mtime': None, 'visits': None}
+
+def _match_columns(columns):
+    names = {c: str(c).strip().lower() for c in columns}
+    mapping = {}
+    for target, spellings in TRACKER_COLUMNS.items():
+        col = next((c for s in spellings for c, n in names.items() if n == s), None)
+        if col is None:
+            col = next((c for s in spellings for c, n in names.items() if n.startswith(s)), None)
+        if col is not None and col not in mapping:
+            mapping[col] = target
+    return mapping
+
+def read_tracker(path):
+    """Reads one Visit Projection Tracker (every sheet of its detected layout) into the canonical tracker columns."""
+    try:
+        frames = []
+        for sheet, header_row in workbook_layout(path):
+            df = pd.read_excel(path, sheet_name=sheet, header=int(header_row), engine='calamine', dtype=object)
+            mapping = _match_columns(df.columns)
+            frames.append(df[list(mapping)].rename(columns=mapping).reindex(columns=list(TRACKER_COLUMNS)))
+    except Exception as e:
+        with open(os.path.join(BASE_DIR, "activity_log.txt"), "a") as f:
+            f.write(f"Error reading visit tracker {os.path.basename(path)}: {e}\n")
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    df['Study'] = os.path.basename(os.path.dirname(path))
+    df['Source File'] = os.path.basename(path)
+    as_of = parse_extraction_date(os.path.basename(path))
+    df['As Of'] = pd.Series(pd.Timestamp(as_of) if as_of else pd.NaT, index=df.index, dtype='datetime64[ns]')
+    df['File Modified'] = pd.Timestamp.fromtimestamp(os.path.getmtime(path)).normalize()
+    return df.dropna(subset=['Site ID', 'Subject'], how='all')
+
+def _parse_dates(values):
+    """Vectorized date parsing for mixed Excel dates and 'DDMONYYYY' strings."""
+    as_text = values.astype(str).str.strip()
+    parsed = pd.to_datetime(as_text, format='%d%b%Y', errors='coerce')
+    return parsed.fillna(pd.to_datetime(as_text.where(parsed.isna()), format='mixed', errors='coerce'))
+
+def build_visit_backlog(root=STUDY_ROOT, max_workers=8):
+    """
+    Reads every catalogued Visit Projection Tracker and computes overdue days for the
+    whole portfolio in one vectorized pass. Overdue days are the tracker's reported
+    '# Days Outstanding' where it has that column, else measured from its extraction date,
+    so rebuilding later does not shift the numbers.
+    """
+    catalog = refresh_catalog(root=root)
+    trackers = catalog[catalog['Category'] == 'Visit Tracker']
+    paths = [os.path.join(root, s, f) for s, f in zip(trackers['Study'], trackers['File'])]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(executor.map(read_tracker, paths))
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=VISIT_COLUMNS)
+
+    visits = pd.concat(frames, ignore_index=True)
+    visits['Projected Date'] = _parse_dates(visits['Projected Date'])
+    reported = pd.to_numeric(visits['Days Outstanding'], errors='coerce')
+    # Trackers without a date in the name: the extraction date implied by the reported
+    # '# Days Outstanding' column, else the file's modification date (several studies
+    # ship a tracker with the same file name, so the median is taken per study and file)
+    implied = (visits['Projected Date'] + pd.to_timedelta(reported, unit='D')).groupby(
+        [visits['Study'], visits['Source File']], observed=True).transform('median')
+    visits['As Of'] = visits['As Of'].fillna(implied).fillna(visits['File Modified'])
+    # The tracker's own '# Days Outstanding' wins; the extraction date only fills rows without it
+    visits['days_overdue'] = reported.fillna((visits['As Of'] - visits['Projected Date']).dt.days.astype('float'))
+
+    # Site keys from the shared dimension, one canonicalization per study
+    visits['Site ID'] = visits.groupby('Study', group_keys=False)['Site ID'].apply(canonical_site_ids)
+    visits = visits.dropna(subset=['Site ID', 'days_overdue']).reset_index(drop=True)
+    visits['site_key'] = pd.concat([site_keys(study, g['Site ID']) for study, g in visits.groupby('Study')]).astype('int32')
+
+    for col in ['Study', 'Site ID', 'Country', 'Visit', 'Source File']:
+        visits[col] = visits[col].astype(str).astype('category')
+    visits['Subject'] = visits['Subject'].astype(str)
+    visits['days_overdue'] = visits['days_overdue'].astype('int32')
+    return visits.drop(columns=['Days Outstanding', 'File Modified'])
+
+def _read_cache():
+    mtime = os.path.getmtime(VISITS_CACHE)
+    if _memo['mtime'] != mtime:
+        _memo.update({'mtime': mtime, 'visits': pd.read_parquet(VISITS_CACHE)})
+    return _memo['visits']
+
+def load_visit_backlog(root=STUDY_ROOT, refresh=True):
+    """
+    Portfolio visit table, rebuilt only when a tracker is newer than the cache, the set of
+    trackers changed, or the sheet layout read from one of them changed.
+    With refresh=False the cached table is used as it is (no catalog scan, no rebuild).
+    """
+    if not refresh:
+        return _read_cache() if os.path.exists(VISITS_CACHE) else pd.DataFrame(columns=VISIT_COLUMNS)
+    catalog = refresh_catalog(root=root)
+    trackers = catalog[catalog['Category'] == 'Visit Tracker']
+    newest = trackers['Modified'].max() if not trackers.empty else 0
+    expected = set(trackers['File'])
+    layout = layout_key([os.path.join(root, s, f) for s, f in zip(trackers['Study'], trackers['File'])])
+
+    if os.path.exists(VISITS_CACHE) and os.path.getmtime(VISITS_CACHE) > newest and stored_layout_key(VISITS_CACHE) == layout:
+        visits = _read_cache()
+        if set(visits['Source File'].astype(str)) <= expected:
+            return visits
+
+    visits = build_visit_backlog(root)
+    with atomic_path(VISITS_CACHE) as tmp:
+        visits.to_parquet(tmp, index=False)
+    store_layout_key(VISITS_CACHE, layout)
+    _memo.update({'mtime': os.path.getmtime(VISITS_CACHE), 'visits': visits})
+    with open(os.path.join(BASE_DIR, "activity_log.txt"), "a") as f:
+        f.write(f"Visit backlog rebuilt: {len(visits)} projected visits from {len(trackers)} tracker(s).\n")
+    return visits
+
+def subject_backlog(study=None, refresh=True):
+    """Per-subject overdue visit count, worst overdue days and upcoming visits."""
+    visits = load_visit_backlog(refresh=refresh)
+    if study is not None:
+        visits = visits[visits['Study'] == study]
+    overdue = visits['days_overdue'] > 0
+    upcoming = (visits['days_overdue'] <= 0) & (visits['days_overdue'] > -UPCOMING_WINDOW_DAYS)
+    grouped = visits.assign(overdue=overdue, upcoming=upcoming, overdue_days=visits['days_overdue'].where(overdue, 0))
+    return grouped.groupby(['Study', 'site_key', 'Site ID', 'Subject'], observed=True).agg(
+        overdue_visit_count=('overdue', 'sum'),
+        max_days_overdue=('overdue_days', 'max'),
+        upcoming_visit_count=('upcoming', 'sum'),
+    ).reset_index()
+
+def site_backlog(study=None, refresh=True):
+    """
+    Per-site visit backlog: overdue visits and subjects, mean/max overdue days, upcoming load.
+    With refresh=False it is computed from the cached visit table as it is.
+    """
+    subjects = subject_backlog(study, refresh)
+    visits = load_visit_backlog(refresh=refresh)
+    if study is not None:
+        visits = visits[visits['Study'] == study]
+    overdue = visits[visits['days_overdue'] > 0]
+    mean_days = overdue.groupby(['Study', 'site_key'], observed=True)['days_overdue'].mean().rename('mean_days_overdue')
+    sites = subjects.groupby(['Study', 'site_key', 'Site ID'], observed=True).agg(
+        overdue_visit_count=('overdue_visit_count', 'sum'),
+        overdue_subject_count=('overdue_visit_count', lambda s: int((s > 0).sum())),
+        max_days_overdue=('max_days_overdue', 'max'),
+        upcoming_visit_count=('upcoming_visit_count', 'sum'),
+    ).join(mean_days, on=['Study', 'site_key'])
+    sites['mean_days_overdue'] = sites['mean_days_overdue'].fillna(0).round(1)
+    return sites.reset_index()
+
+def site_visit_features(study):
+    """Visit backlog columns keyed by site_key, shaped for the anomaly model's feature table."""
+    sites = site_backlog(study)
+    features = sites.set_index('site_key')[['overdue_visit_count', 'max_days_overdue']]
+    return features.astype('int32')
+
+if __name__ == "__main__":
+    sites = site_backlog()
+    print(sites.groupby('Study', observed=True)[['overdue_visit_count', 'upcoming_visit_count']].sum().to_string())
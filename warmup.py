@@ -0,0 +1,158 @@
+"""
+Background cache warm-up.
+On server start a daemon thread pre-populates the caches the first analysts would otherwise
+pay for: per-study pipeline tables, anomaly models and scores, rollups, snapshots and
+subject indexes (study_ingest.py), and the safety-search term index and default scan. Targets are warmed
+most-used first, from access stats recorded by the dashboard. The thread runs at low OS
+priority, keeps a duty cycle, backs off while live sessions are active and can be stopped
+between tasks.
+
+    python warmup.py [--stats]
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from file_locks import file_lock, atomic_path
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATS_FILE = os.path.join(BASE_DIR, ".cache", "access_stats.json")
+
+# Access-stats key of the Safety Search page (warmed: term index and the default query's scan)
+SEARCH_TARGET = "Safety Search"
+
+START_DELAY_SECONDS = 10.0   # let the first live render go first
+DUTY_CYCLE = 0.5             # fraction of wall time the warm-up may spend working
+IDLE_SECONDS = 3.0           # live activity more recent than this pauses the warm-up
+NICENESS = 10
+
+_lock = threading.Lock()
+_state = {'thread': None, 'stop': threading.Event(), 'last_activity': 0.0, 'progress': {}}
+
+def _load_stats():
+    if not os.path.exists(STATS_FILE):
+        return {}
+    try:
+        with open(STATS_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def note_activity():
+    """Marks a live interaction; the warm-up yields while these keep arriving."""
+    _state['last_activity'] = time.time()
+
+def record_access(target):
+    """Counts one access to a study (or the Safety Search page) in the persisted stats."""
+    note_activity()
+    # Read-modify-write of a file shared with the watcher and query service processes
+    with _lock, file_lock("access_stats"):
+        stats = _load_stats()
+        entry = stats.setdefault(target, {'count': 0, 'last': 0})
+        entry['count'] += 1
+        entry['last'] = time.time()
+        with atomic_path(STATS_FILE) as tmp:
+            with open(tmp, "w") as f:
+                json.dump(stats, f, indent=1)
+
+def warmup_plan(root=None):
+    """Warm-up targets (study folders and SEARCH_TARGET), most accessed and most recent first."""
+    from dataset_catalog import STUDY_ROOT
+    root = root or STUDY_ROOT
+    studies = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d))) if os.path.exists(root) else []
+    stats = _load_stats()
+    targets = studies + [SEARCH_TARGET]
+    # Stable sort: never-accessed targets keep folder order, the search index after them
+    return sorted(targets, key=lambda t: (-stats.get(t, {}).get('count', 0), -stats.get(t, {}).get('last', 0)))
+
+def _warm(target):
+    if target == SEARCH_TARGET:
+        from term_index import load_index
+        from safety_signals import safety_files, search_signals, DEFAULT_QUERY
+        load_index()
+        search_signals(DEFAULT_QUERY, safety_files())
+    else:
+        from study_ingest import ingest_study
+        ingest_study(target)
+
+def run_warmup(stop=None, delay=START_DELAY_SECONDS, root=None):
+    """
+    Warms every target in plan order. After a task taking d seconds it rests
+    d * (1 / DUTY_CYCLE - 1), and waits while live sessions were active in the last
+    IDLE_SECONDS. Returns {target: seconds or error} for the targets it got to.
+    """
+    stop = stop or _state['stop']
+    progress = _state['progress']
+    if stop.wait(delay):
+        return progress
+    for target in warmup_plan(root):
+        while time.time() - _state['last_activity'] < IDLE_SECONDS:
+            if stop.wait(IDLE_SECONDS):
+                return progress
+        if stop.is_set():
+            return progress
+        t0 = time.perf_counter()
+        try:
+            _warm(target)
+            progress[target] = round(time.perf_counter() - t0, 2)
+        except Exception as e:
+            progress[target] = f"failed: {e}"
+        elapsed = time.perf_counter() - t0
+        if stop.wait(elapsed * (1 / DUTY_CYCLE - 1)):
+            return progress
+    with open(os.path.join(BASE_DIR, "activity_log.txt"), "a") as f:
+        f.write(f"Warm-up complete: {len(progress)} target(s) in {sum(v for v in progress.values() if isinstance(v, float)):.1f}s of work.\n")
+    return progress
+
+def start_warmup(delay=START_DELAY_SECONDS):
+    """
+    Starts the warm-up daemon thread once per process (set NEST_WARMUP=0 to disable).
+    Returns the thread, or None when disabled.
+    """
+    if os.environ.get("NEST_WARMUP", "1") == "0":
+        return None
+    with _lock:
+        thread = _state['thread']
+        if thread is not None and thread.is_alive():
+            return thread
+
+        def worker():
+            # Linux schedules threads individually, so the niceness applies to this thread only
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), NICENESS)
+            except (AttributeError, OSError):
+                pass
+            run_warmup(delay=delay)
+
+        _state['stop'].clear()
+        thread = threading.Thread(target=worker, name="nest-warmup", daemon=True)
+        _state['thread'] = thread
+        thread.start()
+        return thread
+
+def stop_warmup(timeout=None):
+    """Interrupts the warm-up; the task in flight finishes, no further target is started."""
+    _state['stop'].set()
+    thread = _state['thread']
+    if thread is not None:
+        thread.join(timeout)
+
+def warmup_status():
+    """{target: seconds spent (or error)} for the targets warmed so far in this process."""
+    return dict(_state['progress'])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm the NEST caches, most-used studies first.")
+    parser.add_argument("--stats", action="store_true", help="print the warm-up order and access stats, then exit")
+    args = parser.parse_args()
+    if args.stats:
+        stats = _load_stats()
+        for target in warmup_plan():
+            print(f"{stats.get(target, {}).get('count', 0):6d}  {target}")
+    else:
+        try:
+            for target, seconds in run_warmup(threading.Event(), delay=0).items():
+                print(f"{seconds!s:>10}  {target}")
+        except KeyboardInterrupt:
+            pass
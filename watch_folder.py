@@ -0,0 +1,168 @@
+"""
+Watch-folder daemon for continuous ingestion.
+Watches the study root for new or modified exports (inotify through watchdog, or mtime
+polling when watchdog is unavailable or --poll is given), debounces bursts of file events,
+and re-ingests only the affected studies so dashboard reads find warm caches.
+
+    python watch_folder.py [--root DIR] [--debounce SECONDS] [--poll] [--once]
+"""
+import os
+import time
+import queue
+import argparse
+import threading
+from datetime import datetime
+from dataset_catalog import STUDY_ROOT
+from study_ingest import ingest_study
+from term_index import load_index
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LATENCY_LOG = os.path.join(BASE_DIR, ".cache", "ingest_latency.csv")
+
+DEBOUNCE_SECONDS = 5.0
+POLL_INTERVAL_SECONDS = 2.0
+WATCHED_EXTENSIONS = ('.xlsx', '.zip')
+# Writes only: inotify also reports opens/reads, which ingestion itself would generate
+WRITE_EVENTS = {'created', 'modified', 'moved', 'deleted', 'closed'}
+
+def study_of(path, root=STUDY_ROOT):
+    """Study folder an event path belongs to, or None for files we don't ingest."""
+    name = os.path.basename(path)
+    if name.startswith('~$') or not name.lower().endswith(WATCHED_EXTENSIONS):
+        return None
+    rel = os.path.relpath(os.path.abspath(path), os.path.abspath(root))
+    parts = rel.split(os.sep)
+    if rel.startswith('..') or len(parts) < 2:
+        return None
+    return parts[0]
+
+def start_inotify(root, events):
+    """Native file events through watchdog (inotify on Linux). Returns the observer, or None."""
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        return None
+
+    class _Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if event.is_directory or event.event_type not in WRITE_EVENTS:
+                return
+            for path in (event.src_path, getattr(event, 'dest_path', '')):
+                study = study_of(path, root) if path else None
+                if study:
+                    events.put((study, time.time()))
+
+    observer = Observer()
+    observer.schedule(_Handler(), root, recursive=True)
+    observer.daemon = True
+    observer.start()
+    return observer
+
+def _scan(root):
+    state = {}
+    for dirpath, _, files in os.walk(root):
+        for f in files:
+            path = os.path.join(dirpath, f)
+            if study_of(path, root):
+                try:
+                    state[path] = os.path.getmtime(path)
+                except OSError:
+                    pass
+    return state
+
+def start_polling(root, events, stop, interval=POLL_INTERVAL_SECONDS):
+    """Fallback watcher: compares file mtimes every `interval` seconds."""
+    def loop():
+        previous = _scan(root)
+        while not stop.wait(interval):
+            current = _scan(root)
+            for path in set(previous) | set(current):
+                if previous.get(path) != current.get(path):
+                    events.put((study_of(path, root), time.time()))
+            previous = current
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    return thread
+
+def record_latency(study, first_event, started, finished, timings, ok):
+    """Appends one ingestion to the latency log (event -> warm caches)."""
+    os.makedirs(os.path.dirname(LATENCY_LOG), exist_ok=True)
+    new_file = not os.path.exists(LATENCY_LOG)
+    with open(LATENCY_LOG, "a") as f:
+        if new_file:
+            f.write("study,first_event,finished,queue_wait_s,latency_s,pipeline_s,scoring_s,publish_s,status\n")
+        f.write(",".join([
+            '"' + study.replace('"', '""') + '"',
+            datetime.fromtimestamp(first_event).isoformat(timespec='seconds'),
+            datetime.fromtimestamp(finished).isoformat(timespec='seconds'),
+            f"{started - first_event:.2f}", f"{finished - first_event:.2f}",
+            *(f"{timings.get(k, 0):.2f}" for k in ('pipeline', 'scoring', 'publish')),
+            "ok" if ok else "failed",
+        ]) + "\n")
+
+def process_study(study, first_event, root=STUDY_ROOT):
+    if not os.path.isdir(os.path.join(root, study)):
+        return
+    started = time.time()
+    try:
+        scored, timings = ingest_study(study)
+        # New coding reports also reach the portfolio term index (Safety Search, query service)
+        load_index(root)
+        ok = scored is not None
+    except Exception as e:
+        timings, ok = {}, False
+        with open(os.path.join(BASE_DIR, "activity_log.txt"), "a") as f:
+            f.write(f"Watcher: ingestion of {study} failed: {e}\n")
+    finished = time.time()
+    record_latency(study, first_event, started, finished, timings, ok)
+    with open(os.path.join(BASE_DIR, "activity_log.txt"), "a") as f:
+        f.write(f"Watcher: {study} ingested {finished - first_event:.1f}s after the first file event.\n")
+
+def run(root=STUDY_ROOT, debounce=DEBOUNCE_SECONDS, poll=False, once=False):
+    """
+    Main loop. A study is ingested once no event for it has arrived for `debounce`
+    seconds, so a data manager copying a dozen workbooks triggers a single refresh.
+    With `once`, every study is ingested a single time (cache warm-up) and the loop exits.
+    """
+    if once:
+        for study in sorted(os.listdir(root)):
+            process_study(study, time.time(), root)
+        return
+
+    events, stop = queue.Queue(), threading.Event()
+    observer = None if poll else start_inotify(root, events)
+    if observer is None:
+        start_polling(root, events, stop)
+    print(f"Watching {root} ({'inotify' if observer else 'polling'}, debounce {debounce:.0f}s). Ctrl+C to stop.")
+
+    pending = {}  # study -> [first_event, last_event]
+    try:
+        while True:
+            try:
+                study, stamp = events.get(timeout=0.5)
+                if study:
+                    first, _ = pending.get(study, (stamp, stamp))
+                    pending[study] = (first, stamp)
+            except queue.Empty:
+                pass
+            now = time.time()
+            for study, (first, last) in list(pending.items()):
+                if now - last >= debounce:
+                    del pending[study]
+                    process_study(study, first, root)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        if observer:
+            observer.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch the study folder and ingest new exports.")
+    parser.add_argument("--root", default=STUDY_ROOT)
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS)
+    parser.add_argument("--poll", action="store_true", help="use mtime polling instead of inotify")
+    parser.add_argument("--once", action="store_true", help="ingest every study once and exit")
+    args = parser.parse_args()
+    run(args.root, args.debounce, args.poll, args.once)